@@ -1,9 +1,22 @@
-from sqlalchemy import create_engine, Integer, String, Text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import (
+    create_engine,
+    func,
+    insert,
+    select,
+    Index,
+    Integer,
+    String,
+    Text,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker, Session
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
+from typing import Counter, Dict, Iterator, List, Tuple, Union
+from datetime import datetime, timedelta, timezone
+import collections
 import os
 
 
@@ -30,6 +43,11 @@ class Base(DeclarativeBase):
 # Database model
 class Feedback(Base):
     __tablename__ = "feedback"
+    # Keyset pagination filters on one column and orders by id
+    __table_args__ = (
+        Index("ix_feedback_message_type_id", "message_type", "id"),
+        Index("ix_feedback_feedback_id", "feedback", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     feedback: Mapped[str] = mapped_column(String, nullable=False)
@@ -48,10 +66,48 @@ class Feedback(Base):
             f"message={self.message!r}, user_message={self.user_message!r})"
         )
 
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "feedback": self.feedback,
+            "comments": self.comments,
+            "message_before": self.message_before,
+            "message_after": self.message_after,
+            "message_type": self.message_type,
+            "message": self.message,
+            "user_message": self.user_message,
+        }
+
+
+# Stats row key for the all-time totals
+ALL_DAYS = "all"
+
+
+# Feedback counters maintained on insert, so analytics never scan feedback
+class FeedbackStats(Base):
+    __tablename__ = "feedback_stats"
+
+    message_type: Mapped[str] = mapped_column(String, primary_key=True)
+    feedback: Mapped[str] = mapped_column(String, primary_key=True)
+    # yyyy-mm-dd (UTC) or ALL_DAYS
+    day: Mapped[str] = mapped_column(String, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return (
+            f"FeedbackStats(message_type={self.message_type!r}, "
+            f"feedback={self.feedback!r}, day={self.day!r}, "
+            f"count={self.count!r})"
+        )
+
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# create_all skips indexes of tables that already exist
+for index in Feedback.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+
 
 class FeedbackRequest(BaseModel):
     feedback: str = Field(description="The feedback message.")
@@ -67,6 +123,188 @@ class FeedbackRequest(BaseModel):
     user_message: str = Field(description="The user message.")
 
 
+def query_feedback(
+    db: Session,
+    cursor: Union[int, None] = None,
+    limit: int = 50,
+    message_type: Union[str, None] = None,
+    feedback: Union[str, None] = None,
+) -> List[Feedback]:
+    """Return up to `limit` feedback rows with an id greater than `cursor`.
+
+    Args:
+        db (Session): The database session.
+        cursor (int): The id of the last row of the previous page.
+        limit (int): The maximum number of rows to return.
+        message_type (str): Only return feedback for this message type.
+        feedback (str): Only return feedback with this value.
+    """
+
+    query = select(Feedback).order_by(Feedback.id).limit(limit)
+
+    if cursor is not None:
+        query = query.where(Feedback.id > cursor)
+
+    if message_type is not None:
+        query = query.where(Feedback.message_type == message_type)
+
+    if feedback is not None:
+        query = query.where(Feedback.feedback == feedback)
+
+    return list(db.scalars(query))
+
+
+def iter_feedback(
+    message_type: Union[str, None] = None,
+    feedback: Union[str, None] = None,
+    chunk_size: int = 500,
+) -> Iterator[List[dict]]:
+    """Yield all matching feedback rows in chunks of `chunk_size`.
+
+    Each chunk uses a short-lived session so a slow consumer does not hold a
+    connection for the whole export.
+    """
+
+    cursor = None
+    while True:
+        with SessionLocal() as db:
+            rows = query_feedback(
+                db, cursor, chunk_size, message_type, feedback
+            )
+            chunk = [row.to_dict() for row in rows]
+
+        if not chunk:
+            return
+
+        yield chunk
+        cursor = chunk[-1]["id"]
+
+
+def record_feedback_stats(db: Session, entries: List[Feedback]):
+    """Add the entries to the per day and all-time counters.
+
+    Runs in the caller's transaction so the counters stay consistent with the
+    feedback table.
+    """
+
+    today = datetime.now(timezone.utc).date().isoformat()
+    counts: Counter[Tuple[str, str, str]] = collections.Counter()
+    for entry in entries:
+        counts[(entry.message_type, entry.feedback, today)] += 1
+        counts[(entry.message_type, entry.feedback, ALL_DAYS)] += 1
+
+    statement = sqlite_insert(FeedbackStats).values(
+        [
+            {
+                "message_type": message_type,
+                "feedback": feedback,
+                "day": day,
+                "count": count,
+            }
+            for (message_type, feedback, day), count in counts.items()
+        ]
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["message_type", "feedback", "day"],
+            set_={"count": FeedbackStats.count + statement.excluded.count},
+        )
+    )
+
+
+def backfill_feedback_stats():
+    """Build the all-time counters once for feedback written before them."""
+
+    with SessionLocal() as db:
+        if db.scalar(select(FeedbackStats.day).limit(1)) is not None:
+            return
+
+        totals = db.execute(
+            select(Feedback.message_type, Feedback.feedback, func.count())
+            .group_by(Feedback.message_type, Feedback.feedback)
+        ).all()
+        if not totals:
+            return
+
+        # Workers starting together may all see an empty table, the first
+        # insert wins and the others leave its rows alone
+        statement = sqlite_insert(FeedbackStats).values(
+            [
+                {
+                    "message_type": message_type,
+                    "feedback": feedback,
+                    "day": ALL_DAYS,
+                    "count": count,
+                }
+                for message_type, feedback, count in totals
+            ]
+        )
+        db.execute(statement.on_conflict_do_nothing())
+        db.commit()
+
+
+def get_feedback_stats(days: int = 7) -> dict:
+    """Return all-time and recent per day counts by message type and value.
+
+    Args:
+        days (int): The number of most recent days to include.
+    """
+
+    since = (
+        datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    ).isoformat()
+
+    with SessionLocal() as db:
+        rows = db.scalars(
+            select(FeedbackStats).where(
+                (FeedbackStats.day == ALL_DAYS) | (FeedbackStats.day >= since)
+            )
+        ).all()
+
+    totals: Dict[str, Dict[str, int]] = {}
+    daily: Dict[str, Dict[str, Dict[str, int]]] = {}
+    for row in rows:
+        if row.day == ALL_DAYS:
+            counts = totals.setdefault(row.message_type, {})
+        else:
+            counts = daily.setdefault(row.day, {}).setdefault(
+                row.message_type, {}
+            )
+        counts[row.feedback] = row.count
+
+    return {"totals": totals, "daily": daily}
+
+
+def write_feedback_batch(
+    entries: List[Feedback], session_factory: sessionmaker = SessionLocal
+) -> List[int]:
+    """Insert feedback rows in a single transaction and return their ids."""
+
+    columns = Feedback.__table__.columns.keys()
+    rows = [
+        {
+            column: getattr(entry, column)
+            for column in columns
+            if column != "id"
+        }
+        for entry in entries
+    ]
+
+    # One multi-row INSERT, the ORM would send one statement per row. SQLite
+    # assigns the ids of a single statement in VALUES order.
+    with session_factory() as db:
+        ids = db.scalars(
+            insert(Feedback).values(rows).returning(Feedback.id)
+        ).all()
+        record_feedback_stats(db, entries)
+        db.commit()
+
+    return sorted(ids)
+
+
+backfill_feedback_stats()
+
+
 # Dependency to get a database session
 def get_db():
     db = SessionLocal()
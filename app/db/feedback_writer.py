@@ -0,0 +1,116 @@
+from sqlalchemy.orm import sessionmaker
+from typing import List, Tuple, Union
+import asyncio
+import logging
+
+from db.feedback_db import Feedback, SessionLocal, write_feedback_batch
+
+logger = logging.getLogger(__name__)
+
+QueueItem = Union[Tuple[Feedback, asyncio.Future], None]
+
+
+class FeedbackQueueFull(Exception):
+    pass
+
+
+class FeedbackWriter:
+    """Write-behind queue that batches feedback inserts off the event loop.
+
+    Entries are flushed in one transaction when `max_batch_size` entries are
+    waiting or `flush_interval` seconds after the first one arrived. The
+    database work runs in a worker thread so a slow remote database does not
+    stall the WebSocket connections served by the same loop.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 50,
+        flush_interval: float = 0.2,
+        max_queue_size: int = 1000,
+        session_factory: sessionmaker = SessionLocal,
+    ):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.session_factory = session_factory
+        self.queue: Union[asyncio.Queue[QueueItem], None] = None
+        self.task: Union[asyncio.Task, None] = None
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Flush everything that is queued and stop the writer."""
+        if not self.queue or not self.task:
+            return
+
+        await self.queue.put(None)
+        await self.task
+        self.queue = None
+        self.task = None
+
+    async def submit(self, entry: Feedback) -> int:
+        """Queue a feedback entry and wait until it is written.
+
+        Raises:
+            FeedbackQueueFull: When the queue is at capacity.
+        """
+
+        if not self.queue:
+            raise RuntimeError("Feedback writer is not running")
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((entry, future))
+        except asyncio.QueueFull:
+            raise FeedbackQueueFull("Too many pending feedback writes")
+
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self.flush(batch)
+
+    async def flush(self, batch: List[Tuple[Feedback, asyncio.Future]]):
+        entries = [entry for entry, _ in batch]
+        try:
+            ids = await asyncio.to_thread(
+                write_feedback_batch, entries, self.session_factory
+            )
+        except Exception as e:
+            logger.exception("feedback batch of %d failed", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), entry_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(entry_id)
+
+
+feedback_writer = FeedbackWriter()
@@ -1,13 +1,14 @@
-from datetime import datetime
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from collections import OrderedDict
+from langchain_core.messages import HumanMessage, AIMessage
 from typing import cast, Optional
 from rapidfuzz import fuzz
 
+import asyncio
+import hashlib
 import json
 
 from graph.shared import (
-    llm,
-    gene,
+    current_knowledge,
     HospitalSystemState,
     DoctorAvailability,
     Doctor,
@@ -18,17 +19,29 @@ from graph.shared import (
     ConfirmBooking,
 )
 from utils.api import check_doctor_availabity, book_appointment
+from utils.availability import (
+    compact_availability,
+    format_availability,
+    paginate_availability,
+)
+from utils.date_parser import parse_date_time
+from utils.deadline import DeadlineExceeded
+from utils.patient_info_parser import extract_patient_info
+from utils.metrics import metrics
+from graph.runnables import get_runnable, build_messages, todays_date
+from graph.templates import (
+    use_template,
+    render_appointment_info_request,
+    render_appointment_confirmation,
+    booking_succeeded,
+    render_booking_result,
+)
 
 START = "detect_patient_intent"
 
 NextState = Optional[HospitalSystemState]
 
 ask_availability_system_prompt = """You are an AI assistant helping patients book doctor appointments. Ask the patient for the`doctor's name`, `date` or `date range`, `symptoms description` or a `specialist` if they don't know the doctor's name. Ensure the patient provides all the necessary details to book an appointment. When key details like the `doctor's name` or the `date` are unknown, ask the patient to provide information in a clear and polite manner. If the doctors name is known, state the name in the prompt.
-[Known details]:
-{known_details}
-
-[Unkown details]:
-{missing_details}
 
 Follow these guidelines:
 1. Use well-structured **markdown** to make the prompt user-friendly and visually clear.
@@ -45,8 +58,15 @@ If any field is unknown:
 - **Date or Date Range**: Politely ask the patient to provide the date or date range for the appointment.
 """
 
+ask_availability_context_prompt = """[Known details]:
+{known_details}
 
-def ask_availability_details(state: HospitalSystemState):
+[Unkown details]:
+{missing_details}
+"""
+
+
+async def ask_availability_details(state: HospitalSystemState):
     # Get the doctor name and dates from the state
     doctor_name = state.get("doctor_name", None)
     start_date = state.get("start_date", None)
@@ -78,16 +98,16 @@ def ask_availability_details(state: HospitalSystemState):
         known_details.append(f" - Date: {start_date} to {end_date}")
 
     # Build the system message
-    formatted_system_prompt = ask_availability_system_prompt.format(
+    context = ask_availability_context_prompt.format(
         missing_details="\n".join(missing_details),
         known_details="\n".join(known_details),
     )
 
-    messages = state["messages"][-1:] + [
-        SystemMessage(content=formatted_system_prompt)
-    ]
+    messages = build_messages(
+        ask_availability_system_prompt, state["messages"][-1:], context
+    )
 
-    response = llm.invoke(messages)
+    response = await get_runnable().ainvoke(messages)
 
     return {
         "messages": [response],
@@ -96,7 +116,7 @@ def ask_availability_details(state: HospitalSystemState):
     }
 
 
-availability_chat_system_prompt = """You are an AI assistant tasked with extracting structured information from user queries related to doctor availability. The current date and time is {todays_date_time}. Ensure the extracted information is accurate and follows these guidelines:
+availability_chat_system_prompt = """You are an AI assistant tasked with extracting structured information from user queries related to doctor availability. Ensure the extracted information is accurate and follows these guidelines:
 1. Dates must follow the format `yyyy-mm-dd`.
 2. If only one date is provided, set both the `start_date` and `end_date` to the same value.
 3. Extract the following details, but ignore any that are not explicitly mentioned in the query:
@@ -107,27 +127,35 @@ availability_chat_system_prompt = """You are an AI assistant tasked with extract
 4. If the user show any indication of stopping or cancelling or requesting for information, set the `stop_procceing` true or false.
 """
 
+current_date_context_prompt = "The current date is {todays_date}."
+
 
-def availability_chat_agent(state: HospitalSystemState):
+async def availability_chat_agent(state: HospitalSystemState):
     # Get the query from the state
     query = state.get("query", "")
 
-    # Enforce structured output
-    structured_llm = llm.with_structured_output(DoctorAvailability)
-
-    todays_date_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    formatted_system_prompt = availability_chat_system_prompt.format(
-        todays_date_time=todays_date_time
-    )
+    # Replies that only contain a date or date range don't need the model
+    parsed = parse_date_time(query)
+    if parsed["complete"] and parsed.get("start_date"):
+        metrics.incr("fast_path.availability_chat_agent.hit")
+        availability = DoctorAvailability(
+            start_date=parsed["start_date"], end_date=parsed["end_date"]
+        )
+    else:
+        metrics.incr("fast_path.availability_chat_agent.miss")
 
-    messages = (
-        state["messages"][-1:]
-        + [SystemMessage(content=formatted_system_prompt)]
-        + [HumanMessage(content=query)]
-    )
+        messages = build_messages(
+            availability_chat_system_prompt,
+            state["messages"][-1:],
+            current_date_context_prompt.format(todays_date=todays_date()),
+            query,
+        )
 
-    # Invoke the model
-    availability = cast(DoctorAvailability, structured_llm.invoke(messages))
+        # Invoke the model with structured output
+        availability = cast(
+            DoctorAvailability,
+            await get_runnable(DoctorAvailability).ainvoke(messages),
+        )
 
     next_state: NextHospitalSystemState = {
         "messages": [HumanMessage(content=query)],
@@ -181,16 +209,19 @@ def should_continue_to_find_doctor(state: HospitalSystemState):
 
 
 find_doctor_system_prompt = """
-You are an AI assistant tasked with identifying a doctor's full name and title from the retrieved information below:
-{results}.
+You are an AI assistant tasked with identifying a doctor's full name and title from the retrieved information.
 
 Follow these rules:
 1. If one of the results closely matches the query, extract the doctor's full name and title.
 2. If none of the results match, set both `full_name` and `title` to `None`.
 """
 
+find_doctor_context_prompt = """Retrieved information:
+{results}
+"""
+
 
-def find_doctor(state: HospitalSystemState):
+async def find_doctor(state: HospitalSystemState):
     # Get the doctor name from the state
     doctor_name = state.get("doctor_name", None)
     doctor = state.get("doctor", None)
@@ -200,21 +231,21 @@ def find_doctor(state: HospitalSystemState):
         return {"response_type": "message"}
 
     # Search for the doctor
-    results = gene.search(doctor_name, k=3, q_filter={"section": "doctors"})
-
-    structured_llm = llm.with_structured_output(Doctor)
-
-    formatted_system_prompt = find_doctor_system_prompt.format(
-        results=gene.format(results)
+    gene = current_knowledge().gene
+    # Embedding and FAISS calls block, keep them off the event loop
+    results = await asyncio.to_thread(
+        gene.search, doctor_name, k=3, q_filter={"section": "doctors"}
     )
 
-    messages = state["messages"][-1:] + [
-        SystemMessage(content=formatted_system_prompt)
-    ]
+    messages = build_messages(
+        find_doctor_system_prompt,
+        state["messages"][-1:],
+        find_doctor_context_prompt.format(results=gene.format(results)),
+    )
 
     doctor = cast(
         Doctor,
-        structured_llm.invoke(messages),
+        await get_runnable(Doctor).ainvoke(messages),
     )
 
     next_state: NextHospitalSystemState = {
@@ -238,13 +269,15 @@ def find_doctor(state: HospitalSystemState):
 
 
 get_availability_system_prompt = """
-You are an AI assistant tasked with generating a structured response for a doctor's availability. Based on the availability data below:
-{availability}
+You are an AI assistant tasked with generating a structured response for a doctor's availability based on the availability data provided.
 
 Follow these rules:
-1. Check if the availability data is empty or populated.
-   - If empty, set `response_type` to `"no-availability"` and generate an appropriate response to inform the user that no slots are available.
-   - If populated, set `response_type` to `"availability-list"` and generate a clear response with a message before and after the list of available slots asking the user to select or enter a slot.
+1. The availability data lists one day per line with its available time ranges. The list is shown to the user separately.
+2. Set `response_type` to `"availability-list"` and generate a clear response with a message before and after the list of available slots asking the user to select or enter a slot.
+"""
+
+get_availability_context_prompt = """Availability data for {doctor_name}:
+{availability}{more_days}
 """
 
 
@@ -264,41 +297,55 @@ def should_continue_to_check_availability(state: HospitalSystemState):
     return "check_doctor_availability"
 
 
-def check_doctors_availability(state: HospitalSystemState):
+async def check_doctors_availability(state: HospitalSystemState):
     name = cast(str, state.get("doctor").full_name)
     start_date = state.get("start_date")
     end_date = state.get("end_date")
 
-    availability = check_doctor_availabity(name, start_date, end_date)
+    availability = await check_doctor_availabity(name, start_date, end_date)
     doctor_id = availability.get("doctor_id", None)
-    availability = availability.get("availability", [])
-    formatted_system_prompt = get_availability_system_prompt.format(
-        availability=json.dumps(availability, indent=2)
-    )
-
-    structured_llm = llm.with_structured_output(Availability)
-    messages = state["messages"][-1:] + [
-        SystemMessage(content=formatted_system_prompt)
-    ]
+    # Grouped by day with merged time ranges, for the prompt, the checkpoint
+    # and the client
+    availability = compact_availability(availability.get("availability", []))
 
-    response = cast(Availability, structured_llm.invoke(messages))
-
-    next_state = {
+    next_state: NextHospitalSystemState = {
         "availability": availability,
         "doctor_id": doctor_id,
     }
 
-    if response.response_type == "availability-list":
-        next_state["response_type"] = "availability-list"
-        next_state["response_before"] = response.response_before
-        next_state["response_after"] = response.response_after
-        next_state["status"] = "stopped"
-        next_state["loading_message"] = ""
-    else:
-        next_state["messages"] = [AIMessage(content=response.response)]
+    if not availability:
+        next_state["messages"] = [
+            AIMessage(
+                content=f"{name} has no available slots from {start_date} "
+                f"to {end_date}."
+            )
+        ]
         next_state["response_type"] = "message"
         next_state["status"] = "running"
         next_state["loading_message"] = "Asking for availability details..."
+        return next_state
+
+    first_page = paginate_availability(availability)
+    more_days = len(availability) - len(first_page["days"])
+    messages = build_messages(
+        get_availability_system_prompt,
+        state["messages"][-1:],
+        get_availability_context_prompt.format(
+            doctor_name=name,
+            availability=format_availability(first_page["days"]),
+            more_days=f"\n...and {more_days} more days" if more_days else "",
+        ),
+    )
+
+    response = cast(
+        Availability, await get_runnable(Availability).ainvoke(messages)
+    )
+
+    next_state["response_type"] = "availability-list"
+    next_state["response_before"] = response.response_before
+    next_state["response_after"] = response.response_after
+    next_state["status"] = "stopped"
+    next_state["loading_message"] = ""
 
     return next_state
 
@@ -318,7 +365,7 @@ def should_continue_to_get_appointment_date_and_time(
 
 
 get_appointment_date_system_prompt = """
-You are an AI assistant tasked with extracting structured appointment date information from user queries. This is the initial start date {start_date} and end date {end_date}.
+You are an AI assistant tasked with extracting structured appointment date information from user queries.
 Follow these rules:
 1. Extract the following fields if they are mentioned:
    - `date`: The date of the appointment in `yyyy-mm-dd` format.
@@ -329,25 +376,48 @@ Follow these rules:
 4. If the user show any indication of stopping or cancelling or requesting for information, set the `stop_procceing` true or false.
 """
 
+get_appointment_date_context_prompt = (
+    "This is the initial start date {start_date} and end date {end_date}."
+)
+
 
-def get_appointment_date_time(state: HospitalSystemState):
+async def get_appointment_date_time(state: HospitalSystemState):
     """Get the appointment date and time from the user"""
     query = state.get("query", "")
     start_date = state.get("start_date", "")
     end_date = state.get("end_date", "")
 
-    structured_llm = llm.with_structured_output(AppointmentDate)
-    formatted_system_prompt = get_appointment_date_system_prompt.format(
-        start_date=start_date, end_date=end_date
-    )
-
-    messages = (
-        state["messages"][-1:]
-        + [SystemMessage(content=formatted_system_prompt)]
-        + [HumanMessage(content=query)]
-    )
+    # Replies like "20 Nov from 10:00 to 10:30" don't need the model, a
+    # multi-day range still has to be resolved to a single date
+    parsed = parse_date_time(query)
+    if (
+        parsed["complete"]
+        and len(parsed) > 1
+        and parsed.get("start_date") == parsed.get("end_date")
+    ):
+        metrics.incr("fast_path.get_appointment_date_time.hit")
+        appointment_date = AppointmentDate(
+            date=parsed.get("start_date")
+            or (start_date if parsed.get("start_time") else None),
+            start_time=parsed.get("start_time"),
+            end_time=parsed.get("end_time"),
+        )
+    else:
+        metrics.incr("fast_path.get_appointment_date_time.miss")
+
+        messages = build_messages(
+            get_appointment_date_system_prompt,
+            state["messages"][-1:],
+            get_appointment_date_context_prompt.format(
+                start_date=start_date, end_date=end_date
+            ),
+            query,
+        )
 
-    appointment_date = cast(AppointmentDate, structured_llm.invoke(messages))
+        appointment_date = cast(
+            AppointmentDate,
+            await get_runnable(AppointmentDate).ainvoke(messages),
+        )
 
     next_state: NextHospitalSystemState = {
         "messages": [HumanMessage(content=query)],
@@ -400,9 +470,6 @@ def should_continue_to_ask_appointment_info(state: HospitalSystemState):
 ask_appointment_info_system_prompt = """
 You are an AI assistant helping patients book doctor appointments. Your task is to ask patients to provide their `full name`, `email`, and `reason` for the appointment. Ask the patient for the information in a clear and polite manner.
 
-[missing]:
-{missing_details}
-
 Follow these guidelines:
 1. Use well-structured **markdown** to make the prompt user-friendly and visually clear.
 2. List all the details that user needs to provide for the appointment.
@@ -416,8 +483,12 @@ Ensure the response is polite, concise, and easy to understand.
 NEVER STATE THE DETAILS ARE MISSING, ASK FOR THEM INSTEAD.
 """
 
+ask_appointment_info_context_prompt = """[missing]:
+{missing_details}
+"""
 
-def ask_appointment_info(state: HospitalSystemState):
+
+async def ask_appointment_info(state: HospitalSystemState):
     name = state.get("patient_name", None)
     email = state.get("patient_email", None)
     reason = state.get("patient_reason", None)
@@ -425,23 +496,32 @@ def ask_appointment_info(state: HospitalSystemState):
     missing_details = []
 
     if not name:
-        missing_details.append(" - Full Name")
+        missing_details.append("Full Name")
 
     if not email:
-        missing_details.append(" - Email")
+        missing_details.append("Email")
 
     if not reason:
-        missing_details.append(" - Reason")
+        missing_details.append("Reason")
 
-    formatted_system_prompt = ask_appointment_info_system_prompt.format(
-        missing_details="\n".join(missing_details)
-    )
+    if use_template("ask_appointment_info"):
+        response = AIMessage(
+            content=render_appointment_info_request(missing_details)
+        )
+    else:
+        context = ask_appointment_info_context_prompt.format(
+            missing_details="\n".join(
+                f" - {detail}" for detail in missing_details
+            )
+        )
 
-    messages = state["messages"][-1:] + [
-        SystemMessage(content=formatted_system_prompt)
-    ]
+        messages = build_messages(
+            ask_appointment_info_system_prompt,
+            state["messages"][-1:],
+            context,
+        )
 
-    response = llm.invoke(messages)
+        response = await get_runnable().ainvoke(messages)
 
     if missing_details:
         status = "stopped"
@@ -482,18 +562,31 @@ You are an AI assistant tasked with extracting structured appointment informatio
 If any field is not mentioned, exclude it from the output."""
 
 
-def get_appointment_info(state: HospitalSystemState):
+async def get_appointment_info(state: HospitalSystemState):
     query = state.get("query", "")
 
-    structured_llm = llm.with_structured_output(AppointmentInfo)
+    # Replies like "jane@doe.com" or "my name is Jane Doe" don't need the model
+    extracted = extract_patient_info(query)
+    if extracted["complete"]:
+        metrics.incr("fast_path.get_appointment_info.hit")
+        appointment_info = AppointmentInfo(
+            full_name=extracted.get("full_name"),
+            email=extracted.get("email"),
+            reason=extracted.get("reason"),
+        )
+    else:
+        metrics.incr("fast_path.get_appointment_info.miss")
 
-    messages = (
-        state["messages"][-1:]
-        + [SystemMessage(content=get_appointment_info_system_prompt)]
-        + [HumanMessage(content=query)]
-    )
+        messages = build_messages(
+            get_appointment_info_system_prompt,
+            state["messages"][-1:],
+            query=query,
+        )
 
-    appointment_info = cast(AppointmentInfo, structured_llm.invoke(messages))
+        appointment_info = cast(
+            AppointmentInfo,
+            await get_runnable(AppointmentInfo).ainvoke(messages),
+        )
 
     next_state: NextHospitalSystemState = {
         "messages": [HumanMessage(content=query)],
@@ -550,6 +643,13 @@ def should_continue_to_confirm_appointment(state: HospitalSystemState):
 
 confirm_appointment_prompt = """
 You are an AI assistant helping to finalize appointment bookings. When asking for confirmation, present the details clearly and request the user to confirm or modify the information.
+
+Use the following guidelines:
+1. Format the response in **markdown**.
+2. Clearly display all details of the appointment for review.
+3. Provide clear options for the user to confirm or make changes. """
+
+confirm_appointment_context_prompt = """Appointment details:
 doctor_name: {doctor_name}
 appointment_date: {appointment_date}
 start_time: {start_time}
@@ -557,14 +657,20 @@ end_time: {end_time}
 full_name: {full_name}
 email: {email}
 reason: {reason}
+"""
 
-Use the following guidelines:
-1. Format the response in **markdown**.
-2. Clearly display all details of the appointment for review.
-3. Provide clear options for the user to confirm or make changes. """
 
+async def ask_appointment_confirmation(state: HospitalSystemState):
+    if use_template("ask_appointment_confirmation"):
+        return {
+            "messages": [
+                AIMessage(content=render_appointment_confirmation(state))
+            ],
+            "response_type": "message",
+            "status": "stopped",
+            "loading_message": "",
+        }
 
-def ask_appointment_confirmation(state: HospitalSystemState):
     doctor_name = state.get("doctor").full_name
     appointment_date = state.get("appointment_date")
     start_time = state.get("start_time")
@@ -573,7 +679,7 @@ def ask_appointment_confirmation(state: HospitalSystemState):
     email = state.get("patient_email")
     reason = state.get("patient_reason")
 
-    formatted_system_prompt = confirm_appointment_prompt.format(
+    context = confirm_appointment_context_prompt.format(
         doctor_name=doctor_name,
         appointment_date=appointment_date,
         start_time=start_time,
@@ -583,11 +689,11 @@ def ask_appointment_confirmation(state: HospitalSystemState):
         reason=reason,
     )
 
-    messages = state["messages"][-1:] + [
-        SystemMessage(content=formatted_system_prompt)
-    ]
+    messages = build_messages(
+        confirm_appointment_prompt, state["messages"][-1:], context
+    )
 
-    response = llm.invoke(messages)
+    response = await get_runnable().ainvoke(messages)
 
     return {
         "messages": [response],
@@ -607,7 +713,7 @@ You are an AI assistant tasked with determining if the user has confirmed their
  """
 
 
-def get_appointment_confirmation(state: HospitalSystemState):
+async def get_appointment_confirmation(state: HospitalSystemState):
     query = state.get("query", "")
     appointment_date = state.get("appointment_date")
     start_time = state.get("start_time")
@@ -617,15 +723,15 @@ def get_appointment_confirmation(state: HospitalSystemState):
     reason = state.get("patient_reason")
     doctor_name = state.get("doctor_name")
 
-    structured_llm = llm.with_structured_output(ConfirmBooking)
-
-    messages = (
-        state["messages"][-1:]
-        + [SystemMessage(content=get_appointment_confirmation_system_prompt)]
-        + [HumanMessage(content=query)]
+    messages = build_messages(
+        get_appointment_confirmation_system_prompt,
+        state["messages"][-1:],
+        query=query,
     )
 
-    confirmation = cast(ConfirmBooking, structured_llm.invoke(messages))
+    confirmation = cast(
+        ConfirmBooking, await get_runnable(ConfirmBooking).ainvoke(messages)
+    )
 
     next_state: NextHospitalSystemState = {
         "messages": [HumanMessage(content=query)],
@@ -727,41 +833,118 @@ def should_continue_to_book_confirm_appointment(state: HospitalSystemState):
 
 book_appointment_system_prompt = """
 You are an AI assistant tasked with formatting the response from the booking API and presenting it to the user for confirmation of success in a clear and professional manner.
-Response:
-{response}
 
 Follow these guidelines:
 1. Format the response in **markdown** for clarity.
 2. Display the key details of the booking response, ensuring they are easy to read.
 3. Ask the user if they needed help with anything else or if they have any questions."""
 
+book_appointment_context_prompt = """Response:
+{response}
+"""
 
-def book_appointment_with_info(state: HospitalSystemState):
-    appointment_date = state.get("appointment_date")
-    start_time = state.get("start_time")
-    end_time = state.get("end_time")
-    full_name = state.get("patient_name")
-    email = state.get("patient_email")
-    reason = state.get("patient_reason")
-    doctor_id = state.get("doctor_id")
-
-    response = book_appointment(
-        doctor_id,
-        full_name,
-        email,
-        appointment_date,
-        start_time,
-        end_time,
-        reason,
-    )
-    formatted_system_prompt = book_appointment_system_prompt.format(
-        response=json.dumps(response["data"], indent=2)
-    )
 
-    messages = state["messages"][-1:] + [
-        SystemMessage(content=formatted_system_prompt)
+# Booking requests by booking key. They are kept outside the checkpoints, so
+# a turn rolled back after its request went out gets the same response again
+# instead of booking the slot twice.
+MAX_BOOKINGS = 1000
+bookings: "OrderedDict[str, asyncio.Task]" = OrderedDict()
+
+
+def booking_key(state: HospitalSystemState) -> str:
+    details = [
+        state.get(key)
+        for key in (
+            "doctor_id",
+            "appointment_date",
+            "start_time",
+            "end_time",
+            "patient_email",
+        )
     ]
-    response = llm.invoke(messages)
+    return hashlib.sha256(
+        json.dumps(details, default=str).encode()
+    ).hexdigest()
+
+
+def finished_booking(task: asyncio.Task) -> Optional[dict]:
+    if not task.done() or task.cancelled() or task.exception():
+        return None
+    return task.result()
+
+
+def task_response(task: asyncio.Task) -> dict:
+    return finished_booking(task) or {"error": "The booking request failed"}
+
+
+async def book_once(state: HospitalSystemState) -> dict:
+    """Book the appointment in `state`, at most once while it is accepted.
+
+    A request still in flight or accepted is reused, a failed one is sent
+    again with the same idempotency key.
+
+    Args:
+        state (HospitalSystemState): The state holding the confirmed details.
+    """
+
+    key = booking_key(state)
+    task = bookings.get(key)
+    if task and (not task.done() or booking_succeeded(task_response(task))):
+        metrics.incr("bookings.reused")
+    else:
+        task = asyncio.create_task(
+            book_appointment(
+                state.get("doctor_id"),
+                state.get("patient_name"),
+                state.get("patient_email"),
+                state.get("appointment_date"),
+                state.get("start_time"),
+                state.get("end_time"),
+                state.get("patient_reason"),
+                idempotency_key=key,
+            )
+        )
+        bookings[key] = task
+        bookings.move_to_end(key)
+        while len(bookings) > MAX_BOOKINGS:
+            bookings.popitem(last=False)
+
+    # Cancelling the turn leaves the request running and its result recorded
+    return await asyncio.shield(task)
+
+
+def book_appointment_fallback(state: HospitalSystemState):
+    """Reply from the booking response when the turn runs out of time."""
+    task = bookings.get(booking_key(state))
+    response = finished_booking(task) if task else None
+    if response is None:
+        # Resending the message waits for the request still in flight
+        raise DeadlineExceeded("book_appointment")
+
+    message = AIMessage(content=render_booking_result(state, response))
+    return {
+        "messages": [message],
+        "response_type": "message",
+        "status": "stopped",
+        "loading_message": "",
+    }
+
+
+async def book_appointment_with_info(state: HospitalSystemState):
+    response = await book_once(state)
+
+    # A failed booking is never handed to the model to be worded as a success
+    if use_template("book_appointment") or not booking_succeeded(response):
+        response = AIMessage(content=render_booking_result(state, response))
+    else:
+        context = book_appointment_context_prompt.format(
+            response=json.dumps(response["data"], indent=2)
+        )
+
+        messages = build_messages(
+            book_appointment_system_prompt, state["messages"][-1:], context
+        )
+        response = await get_runnable().ainvoke(messages)
 
     return {
         "messages": [response],
@@ -1,5 +1,6 @@
-from langchain_core.messages import HumanMessage, SystemMessage
-from graph.shared import llm, HospitalSystemState
+from langchain_core.messages import AIMessage, HumanMessage
+from graph.shared import current_knowledge, HospitalSystemState
+from graph.runnables import get_runnable, build_messages
 
 
 general_info_system_prompt = """
@@ -13,7 +14,7 @@ Follow these rules:
      - Gratitude: "You're welcome! Let me know if there's anything else I can help you with."
 
 2. **For all other general information queries unrelated to greetings or gratitude:
-   - Politely inform the user that you are a system designed to assist users with King Faisal Hospital services.
+   - Politely inform the user that you are a system designed to assist users with {hospital_name} services.
    - Provide an overview of your capabilities:
      - Booking appointments.
      - Retrieving doctor or service information.
@@ -22,17 +23,36 @@ Follow these rules:
 """
 
 
-def general_info_response(state: HospitalSystemState):
+async def general_info_response(state: HospitalSystemState):
     query = state.get("query", "")
 
     user_message = HumanMessage(content=query)
-    messages = (
-        state["messages"]
-        + [SystemMessage(content=general_info_system_prompt)]
-        + [user_message]
+    system_prompt = general_info_system_prompt.format(
+        hospital_name=current_knowledge().hospital_name
     )
+    messages = build_messages(
+        system_prompt, state["messages"] + [user_message]
+    )
+
+    response = await get_runnable().ainvoke(messages)
 
-    response = llm.invoke(messages)
+    return {
+        "messages": [user_message, response],
+        "response_type": "message",
+        "status": "completed",
+        "loading_message": "",
+    }
+
+
+def general_info_fallback(state: HospitalSystemState):
+    """Canned reply used when the turn runs out of time."""
+    user_message = HumanMessage(content=state.get("query", ""))
+    response = AIMessage(
+        content=(
+            "Sorry, this is taking longer than expected. "
+            "Please try again in a moment."
+        )
+    )
 
     return {
         "messages": [user_message, response],
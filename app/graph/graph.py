@@ -1,16 +1,23 @@
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import START, END, StateGraph
-from langgraph.checkpoint.memory import MemorySaver
-from graph.shared import HospitalSystemState
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import StateSnapshot
+from graph.shared import HospitalSystemState, ModelTier
+from graph.memory import PruningMemorySaver
+from utils.deadline import with_deadline
+from utils.tracing import traced_node
+from typing import Dict
+import os
 
 from graph.prelimary import (
     detect_patient_intent,
+    detect_patient_intent_fallback,
     extract_preliminary_info,
     find_potential_doctors,
     should_continue_to_next_branch,
     should_continue_to_find_potential_doctors,
 )
-from graph.general_info import general_info_response
+from graph.general_info import general_info_response, general_info_fallback
 from graph.booking_appointment import (
     availability_chat_agent,
     ask_availability_details,
@@ -22,6 +29,7 @@ from graph.booking_appointment import (
     get_appointment_confirmation,
     ask_appointment_confirmation,
     book_appointment_with_info,
+    book_appointment_fallback,
     should_continue_to_check_availability,
     should_continue_to_ask_appointment_info,
     should_continue_to_confirm_appointment,
@@ -31,22 +39,58 @@ from graph.booking_appointment import (
     should_continue_to_find_doctor,
 )
 
-from graph.hospital_info import retrieve_hospital_info, hospital_chat_agent
+from graph.hospital_info import (
+    retrieve_hospital_info,
+    hospital_chat_agent,
+    hospital_chat_fallback,
+)
 
 
-hospital_memory = MemorySaver()
+hospital_memory = PruningMemorySaver()
+
+# Replies used when a node runs out of time, the others ask to retry
+NODE_FALLBACKS = {
+    "detect_patient_intent": detect_patient_intent_fallback,
+    "general_info_response": general_info_fallback,
+    "hospital_chat_agent": hospital_chat_fallback,
+    "book_appointment": book_appointment_fallback,
+}
+
+# Classification and slot extraction nodes run on the fast tier, the others
+# on the quality tier. FAST_TIER_NODES replaces the list, eg "find_doctor".
+FAST_TIER_NODES = [
+    node.strip()
+    for node in (
+        os.getenv("FAST_TIER_NODES")
+        or "detect_patient_intent,get_appointment_date_time,"
+        "get_appointment_info,get_appointment_confirmation"
+    ).split(",")
+    if node.strip()
+]
+NODE_MODEL_TIERS: Dict[str, ModelTier] = {
+    node: "fast" for node in FAST_TIER_NODES
+}
 
 
 def build_hospital_system_graph():
     hospital_builder = StateGraph(HospitalSystemState)
 
+    def add_node(name: str, node):
+        # Every node is bounded by the time left in the turn, and its model
+        # calls go to the tier in its metadata
+        hospital_builder.add_node(
+            name,
+            traced_node(
+                name, with_deadline(name, node, NODE_FALLBACKS.get(name))
+            ),
+            metadata={"model_tier": NODE_MODEL_TIERS.get(name, "quality")},
+        )
+
     # Preliminary info
-    hospital_builder.add_node("detect_patient_intent", detect_patient_intent)
-    hospital_builder.add_node(
-        "preliminary_info_extraction", extract_preliminary_info
-    )
-    hospital_builder.add_node("find_potential_doctors", find_potential_doctors)
-    hospital_builder.add_node("general_info_response", general_info_response)
+    add_node("detect_patient_intent", detect_patient_intent)
+    add_node("preliminary_info_extraction", extract_preliminary_info)
+    add_node("find_potential_doctors", find_potential_doctors)
+    add_node("general_info_response", general_info_response)
 
     hospital_builder.add_edge(START, "detect_patient_intent")
     hospital_builder.add_edge(
@@ -71,35 +115,23 @@ def build_hospital_system_graph():
     )
 
     # Hospital Info
-    hospital_builder.add_node("hospital_chat_agent", hospital_chat_agent)
-    hospital_builder.add_node("retrieve_hospital_info", retrieve_hospital_info)
+    add_node("hospital_chat_agent", hospital_chat_agent)
+    add_node("retrieve_hospital_info", retrieve_hospital_info)
 
     hospital_builder.add_edge("retrieve_hospital_info", "hospital_chat_agent")
     hospital_builder.add_edge("hospital_chat_agent", END)
 
     # Booking appointment
-    hospital_builder.add_node(
-        "availability_chat_agent", availability_chat_agent
-    )
-    hospital_builder.add_node(
-        "ask_availability_details", ask_availability_details
-    )
-    hospital_builder.add_node("find_doctor", find_doctor)
-    hospital_builder.add_node(
-        "check_doctor_availability", check_doctors_availability
-    )
-    hospital_builder.add_node(
-        "get_appointment_date_time", get_appointment_date_time
-    )
-    hospital_builder.add_node("ask_appointment_info", ask_appointment_info)
-    hospital_builder.add_node("get_appointment_info", get_appointment_info)
-    hospital_builder.add_node(
-        "ask_appointment_confirmation", ask_appointment_confirmation
-    )
-    hospital_builder.add_node(
-        "get_appointment_confirmation", get_appointment_confirmation
-    )
-    hospital_builder.add_node("book_appointment", book_appointment_with_info)
+    add_node("availability_chat_agent", availability_chat_agent)
+    add_node("ask_availability_details", ask_availability_details)
+    add_node("find_doctor", find_doctor)
+    add_node("check_doctor_availability", check_doctors_availability)
+    add_node("get_appointment_date_time", get_appointment_date_time)
+    add_node("ask_appointment_info", ask_appointment_info)
+    add_node("get_appointment_info", get_appointment_info)
+    add_node("ask_appointment_confirmation", ask_appointment_confirmation)
+    add_node("get_appointment_confirmation", get_appointment_confirmation)
+    add_node("book_appointment", book_appointment_with_info)
 
     hospital_builder.add_edge(
         "ask_availability_details", "availability_chat_agent"
@@ -178,6 +210,24 @@ def get_memory_config(id: str) -> RunnableConfig:
     return {"configurable": {"thread_id": id}}
 
 
+def rollback_to_checkpoint(graph: CompiledStateGraph, snapshot: StateSnapshot):
+    """Discard the checkpoints written after `snapshot` by a cancelled run.
+
+    Args:
+        graph (CompiledStateGraph): The compiled hospital system graph.
+        snapshot (StateSnapshot): The state taken before the run started.
+    """
+
+    if snapshot.config["configurable"].get("checkpoint_id"):
+        # Copy the snapshot forward so it becomes the latest checkpoint
+        graph.update_state(snapshot.config, None)
+    else:
+        # The thread had no checkpoint before the run
+        hospital_memory.delete_thread(
+            snapshot.config["configurable"]["thread_id"]
+        )
+
+
 def save_graph_image_to_file(file_path: str):
     graph = build_hospital_system_graph()
     graph.get_graph(xray=1).draw_mermaid_png(output_file_path=file_path)
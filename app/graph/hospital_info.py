@@ -1,34 +1,35 @@
-from graph.shared import llm, gene, HospitalSystemState
-from datetime import datetime
-from langchain_core.messages import HumanMessage, SystemMessage
+from graph.shared import current_knowledge, HospitalSystemState
+from graph.runnables import get_runnable, build_messages, todays_date
+from langchain_core.messages import AIMessage, HumanMessage
 
-hospital_info_system_prompt = """You are an AI assistant providing hospital information and booking appointments. Format your responses clearly with markdown, highlighting all important information, and offer further assistance if needed. The current date and time is {todays_date_time}.
-Based on the retrieved information below, respond appropriately:
+hospital_info_system_prompt = """You are an AI assistant providing hospital information and booking appointments. Format your responses clearly with markdown, highlighting all important information, and offer further assistance if needed.
+Respond appropriately based on the retrieved information provided with the query.
+"""
+
+hospital_info_context_prompt = """The current date is {todays_date}.
+Retrieved information:
 {results}
 """
 
 
-def hospital_chat_agent(state: HospitalSystemState):
+async def hospital_chat_agent(state: HospitalSystemState):
     # Get the query and results from the state
     query = state.get("query", "")
     results = state.get("search_results", "")
 
-    # Build the system message
-    todays_date_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    system_message = hospital_info_system_prompt.format(
-        todays_date_time=todays_date_time, results=results
+    # Build the context message
+    context = hospital_info_context_prompt.format(
+        todays_date=todays_date(), results=results
     )
 
-    # Add the system message and the user query to the messages
+    # Add the system message, the context and the user query to the messages
     user_message = HumanMessage(content=query)
-    messages = (
-        state["messages"]
-        + [SystemMessage(content=system_message)]
-        + [user_message]
+    messages = build_messages(
+        hospital_info_system_prompt, state["messages"], context, query
     )
 
     # Invoke the model
-    response = llm.invoke(messages)
+    response = await get_runnable().ainvoke(messages)
 
     # Delete all but the 2 most recent messages
     # delete_messages = [RemoveMessage(id=message.id) for message in state["messages"][:-2]]
@@ -38,22 +39,54 @@ def hospital_chat_agent(state: HospitalSystemState):
         "response_type": "message",
         "loading_message": "",
         "status": "completed",
+        # Only needed for this answer, no need to checkpoint it
+        "search_results": "",
+        "search_query": "",
     }
 
 
+def hospital_chat_fallback(state: HospitalSystemState):
+    """Answer with the retrieved results when the model runs out of time."""
+    user_message = HumanMessage(content=state.get("query", ""))
+    response = AIMessage(
+        content=(
+            "Here is the information I found for your question:\n\n"
+            f"{state.get('search_results', '') or 'No results found.'}"
+        )
+    )
+
+    return {
+        "messages": [user_message, response],
+        "response_type": "message",
+        "loading_message": "",
+        "status": "completed",
+        "search_results": "",
+        "search_query": "",
+    }
+
+
+def search_hospital_info(query: str) -> str:
+    gene = current_knowledge().gene
+    results = gene.search(query, k=15)
+    if results:
+        return gene.format(results)
+
+    return "No results found."
+
+
 def retrieve_hospital_info(state: HospitalSystemState):
     # Get the query from the state
     query = state["query"]
 
-    # Search for the query
-    results = gene.search(query, k=15)
-    if results:
-        results = gene.format(results)
+    # Reuse the results retrieved alongside intent detection
+    if state.get("search_query", None) == query:
+        results = state.get("search_results", "")
     else:
-        results = "No results found."
+        results = search_hospital_info(query)
 
     return {
         "search_results": results,
+        "search_query": query,
         "loading_message": "Processing search results...",
         "status": "running",
     }
@@ -0,0 +1,90 @@
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from typing import Dict, TypedDict
+import os
+
+from utils.metrics import metrics
+
+# A turn writes at most one checkpoint per step, and the graph stops after 25
+# steps. Keeping more than that means the checkpoint taken before a turn is
+# still there to roll back to.
+MIN_CHECKPOINT_RETENTION = 30
+CHECKPOINT_RETENTION = max(
+    int(os.getenv("CHECKPOINT_RETENTION") or MIN_CHECKPOINT_RETENTION),
+    MIN_CHECKPOINT_RETENTION,
+)
+
+
+class ThreadSize(TypedDict):
+    checkpoints: int
+    bytes: int
+
+
+class PruningMemorySaver(MemorySaver):
+    """A MemorySaver that only keeps the latest checkpoints of each thread.
+
+    Older checkpoints and their pending writes are dropped on every put, so
+    the memory used by a session stays bounded by the size of its state.
+    """
+
+    def __init__(self, retention: int = CHECKPOINT_RETENTION):
+        super().__init__()
+        self.retention = retention
+        self.thread_bytes: Dict[str, int] = {}
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+
+        thread_id = next_config["configurable"]["thread_id"]
+        checkpoint_ns = next_config["configurable"]["checkpoint_ns"]
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) > self.retention:
+            # Checkpoint ids sort in creation order
+            for checkpoint_id in sorted(checkpoints)[: -self.retention]:
+                del checkpoints[checkpoint_id]
+                writes_key = (thread_id, checkpoint_ns, checkpoint_id)
+                self.writes.pop(writes_key, None)
+                metrics.incr("checkpoints.pruned")
+
+        self.thread_bytes[thread_id] = self.thread_size(thread_id)["bytes"]
+        metrics.set("checkpoints.bytes", sum(self.thread_bytes.values()))
+        return next_config
+
+    def delete_thread(self, thread_id: str):
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            del self.writes[key]
+        self.thread_bytes.pop(thread_id, None)
+        metrics.set("checkpoints.bytes", sum(self.thread_bytes.values()))
+
+    def thread_size(self, thread_id: str) -> ThreadSize:
+        """Count the checkpoints of a thread and their serialized bytes."""
+        size: ThreadSize = {"checkpoints": 0, "bytes": 0}
+        for checkpoint_ns, checkpoints in self.storage[thread_id].items():
+            for checkpoint_id, saved in checkpoints.items():
+                checkpoint, metadata, _ = saved
+                size["checkpoints"] += 1
+                size["bytes"] += len(checkpoint[1]) + len(metadata[1])
+                writes = self.writes.get(
+                    (thread_id, checkpoint_ns, checkpoint_id), {}
+                )
+                for _, _, value in writes.values():
+                    size["bytes"] += len(value[1])
+        return size
+
+    def sizes(self) -> Dict[str, ThreadSize]:
+        return {
+            thread_id: self.thread_size(thread_id)
+            for thread_id in list(self.storage)
+        }
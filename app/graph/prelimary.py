@@ -1,17 +1,22 @@
-from langchain_core.messages import HumanMessage, SystemMessage
-from datetime import datetime
 from typing import cast
+import asyncio
+import logging
 
 
 from graph.shared import (
-    gene,
-    llm,
+    current_knowledge,
     HospitalSystemState,
     NextHospitalSystemState,
     HospitalSystem,
     PatientIntent,
     PotentialDoctors,
 )
+from graph.hospital_info import search_hospital_info
+from graph.runnables import get_runnable, build_messages, todays_date
+from utils.get_text_data import find_specialty_doctors
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 
 patient_intent_system_prompt = """
@@ -26,20 +31,49 @@ Guidelines:
 - Carefully analyze the context and keywords in the user's request to determine the intent."""
 
 
-def detect_patient_intent(state: HospitalSystemState):
+async def detect_patient_intent(state: HospitalSystemState):
     query = state.get("query", "")
 
-    structured_llm = llm.with_structured_output(PatientIntent)
+    # Speculatively retrieve hospital info while the intent is classified,
+    # the search does not depend on the intent
+    retrieval = asyncio.ensure_future(
+        asyncio.to_thread(search_hospital_info, query)
+    )
 
-    messages = (
-        state["messages"][-1:]
-        + [SystemMessage(content=patient_intent_system_prompt)]
-        + [HumanMessage(content=query)]
+    messages = build_messages(
+        patient_intent_system_prompt, state["messages"][-1:], query=query
     )
 
-    intent = cast(PatientIntent, structured_llm.invoke(messages))
+    try:
+        intent = cast(
+            PatientIntent,
+            await get_runnable(PatientIntent).ainvoke(messages),
+        )
+    except BaseException:
+        retrieval.cancel()
+        raise
+
+    next_state: NextHospitalSystemState = {"intent": intent.intent}
 
-    return {"intent": intent.intent}
+    if intent.intent != "hospital-info":
+        # Discard the speculative results
+        retrieval.cancel()
+        return next_state
+
+    try:
+        next_state["search_results"] = await retrieval
+        next_state["search_query"] = query
+    except Exception:
+        # retrieve_hospital_info searches again
+        logger.exception("speculative retrieval failed")
+
+    return next_state
+
+
+def detect_patient_intent_fallback(state: HospitalSystemState):
+    # general_info_response answers with its own fallback
+    next_state: NextHospitalSystemState = {"intent": "general-info"}
+    return next_state
 
 
 def should_continue_to_next_branch(state: HospitalSystemState):
@@ -60,7 +94,7 @@ def should_continue_to_next_branch(state: HospitalSystemState):
 
 
 preliminary_info_system_prompt = """
-You are an AI assistant tasked with extracting structured information from user queries related to hospital services and appointments. The current date and time is {todays_date_time}.  Use the following guidelines to extract details:
+You are an AI assistant tasked with extracting structured information from user queries related to hospital services and appointments. Use the following guidelines to extract details:
 
 Information to Extract:
 1. appointment_date: Extract the date of the appointment in yyyy-mm-dd format, if mentioned.
@@ -75,26 +109,22 @@ Notes:
 - Only include keys for fields explicitly mentioned or logically inferred.
 """
 
+preliminary_info_context_prompt = "The current date is {todays_date}."
 
-def extract_preliminary_info(state: HospitalSystemState):
-    query = state.get("query", "")
 
-    structured_llm = llm.with_structured_output(HospitalSystem)
+async def extract_preliminary_info(state: HospitalSystemState):
+    query = state.get("query", "")
 
-    todays_date_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    messages = (
-        state["messages"][-1:]
-        + [
-            SystemMessage(
-                content=preliminary_info_system_prompt.format(
-                    todays_date_time=todays_date_time
-                )
-            )
-        ]
-        + [HumanMessage(content=query)]
+    messages = build_messages(
+        preliminary_info_system_prompt,
+        state["messages"][-1:],
+        preliminary_info_context_prompt.format(todays_date=todays_date()),
+        query,
     )
 
-    info = cast(HospitalSystem, structured_llm.invoke(messages))
+    info = cast(
+        HospitalSystem, await get_runnable(HospitalSystem).ainvoke(messages)
+    )
 
     next_state: NextHospitalSystemState = {}
 
@@ -178,8 +208,9 @@ Follow these rules to generate the response:
      - `doctors`: A list of potential doctors based on the input query. List up to 10 doctors if possible.
      - `prompt_before`: A message explaining the role of the recommended specialists and setting context for the doctor list.
      - `prompt_after`: A message encouraging the user to select a doctor from the list or ask for further assistance.
+"""
 
-[DATA]
+doctors_recommendation_context_prompt = """[DATA]
 Symptoms descriptions: {symptoms_description}
 Specialists: {specialists}
 
@@ -188,32 +219,74 @@ Search data:
 """
 
 
-def find_potential_doctors(state: HospitalSystemState):
+async def find_potential_doctors(state: HospitalSystemState):
     specialists = state.get("specialists", [])
     symptoms_description = state.get("symptoms_description", None)
 
     specialist_search = ""
     symptoms_search = ""
 
+    knowledge = current_knowledge()
+    gene = knowledge.gene
+
     if specialists:
-        specialist_search = gene.search(
-            " OR ".join(specialists), k=15, q_filter={"section": "doctors"}
+        # Exact specialty to doctor links, the vector search is the fallback
+        candidates = find_specialty_doctors(
+            knowledge.specialty_index, specialists
         )
-        specialist_search = gene.format(specialist_search)
+        if candidates:
+            metrics.incr("specialty_index.hit")
+            specialist_search = "".join(
+                f"* {doctor['name']} - {doctor['title']} "
+                f"({doctor['service']})\n"
+                for doctor in candidates
+            )
+        else:
+            metrics.incr("specialty_index.miss")
+            specialist_search = await asyncio.to_thread(
+                gene.search,
+                " OR ".join(specialists),
+                k=15,
+                q_filter={"section": "doctors"},
+            )
+            specialist_search = gene.format(specialist_search)
 
     if symptoms_description:
-        symptoms_search = gene.search(symptoms_description, k=10)
-        symptoms_search = gene.format(symptoms_search)
-
-    general_search = gene.format(
-        gene.search(
-            "General Internal Medicine",
-            k=5,
-            q_filter={"tag": "general internal medicine"},
+        # Narrow the doctors to the closest specialties before the model
+        specialties = await knowledge.specialty_classifier.aclassify(
+            symptoms_description
+        )
+        candidates = find_specialty_doctors(
+            knowledge.specialty_index, [name for name, _ in specialties]
         )
+        if candidates:
+            metrics.incr("specialty_classifier.hit")
+            symptoms_search = (
+                "Closest specialties: "
+                f"{', '.join(name for name, _ in specialties)}\n"
+            )
+            symptoms_search += "".join(
+                f"* {doctor['name']} - {doctor['title']} "
+                f"({doctor['service']})\n"
+                for doctor in candidates
+            )
+        else:
+            metrics.incr("specialty_classifier.miss")
+            symptoms_search = await asyncio.to_thread(
+                gene.search, symptoms_description, k=10
+            )
+            symptoms_search = gene.format(symptoms_search)
+
+    # Embedding and FAISS calls block, keep them off the event loop
+    general_search = await asyncio.to_thread(
+        gene.search,
+        "General Internal Medicine",
+        k=5,
+        q_filter={"tag": "general internal medicine"},
     )
+    general_search = gene.format(general_search)
 
-    formatted_system_prompt = doctors_recommendation_system_prompt.format(
+    context = doctors_recommendation_context_prompt.format(
         symptoms_description=symptoms_description,
         specialists=", ".join(specialists),
         search_data=specialist_search
@@ -223,13 +296,14 @@ def find_potential_doctors(state: HospitalSystemState):
         + general_search,
     )
 
-    structured_llm = llm.with_structured_output(PotentialDoctors)
-
-    messages = state["messages"][-1:] + [
-        SystemMessage(content=formatted_system_prompt)
-    ]
+    messages = build_messages(
+        doctors_recommendation_system_prompt, state["messages"][-1:], context
+    )
 
-    potential_doctors = cast(PotentialDoctors, structured_llm.invoke(messages))
+    potential_doctors = cast(
+        PotentialDoctors,
+        await get_runnable(PotentialDoctors).ainvoke(messages),
+    )
 
     return {
         "doctors_list": potential_doctors.doctors,
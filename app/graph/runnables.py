@@ -0,0 +1,218 @@
+from datetime import datetime
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.load import dumpd
+from langchain_core.messages import AnyMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config
+from pydantic import BaseModel
+import hashlib
+import json
+import os
+
+from graph.shared import (
+    llms,
+    ModelTier,
+    DoctorAvailability,
+    Doctor,
+    Availability,
+    AppointmentDate,
+    AppointmentInfo,
+    ConfirmBooking,
+    PatientIntent,
+    HospitalSystem,
+    PotentialDoctors,
+)
+from utils.metrics import metrics
+from utils.hedging import Hedger
+from utils.single_flight import SingleFlight
+from utils.tracing import tracer
+
+# Share one model call between identical requests in flight at the same time
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true")
+
+
+class PromptCacheMetricsHandler(BaseCallbackHandler):
+    """Records the cached prompt tokens reported by the API for each node.
+
+    Cached tokens are counted as `prompt_cache.<node>.hit` and the rest of the
+    prompt as `prompt_cache.<node>.miss`, so `/metrics` reports the ratio.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.nodes: Dict[UUID, str] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[AnyMessage]],
+        *,
+        run_id: UUID,
+        metadata: Union[Dict[str, Any], None] = None,
+        **kwargs: Any,
+    ):
+        self.nodes[run_id] = (metadata or {}).get("langgraph_node", "unknown")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        node = self.nodes.pop(run_id, "unknown")
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        details = usage.get("prompt_tokens_details") or {}
+        cached_tokens = details.get("cached_tokens") or 0
+
+        for name in ("prompt_cache", f"prompt_cache.{node}"):
+            metrics.incr(f"{name}.hit", cached_tokens)
+            metrics.incr(f"{name}.miss", prompt_tokens - cached_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self.nodes.pop(run_id, None)
+
+
+prompt_cache_metrics = PromptCacheMetricsHandler()
+
+SCHEMAS = (
+    DoctorAvailability,
+    Doctor,
+    Availability,
+    AppointmentDate,
+    AppointmentInfo,
+    ConfirmBooking,
+    PatientIntent,
+    HospitalSystem,
+    PotentialDoctors,
+)
+
+# Built once per model tier and shared by every node
+chat_llms: Dict[ModelTier, Runnable] = {
+    tier: llm.with_config(callbacks=[prompt_cache_metrics])
+    for tier, llm in llms.items()
+}
+structured_llms: Dict[ModelTier, Dict[Type[BaseModel], Runnable]] = {
+    tier: {
+        schema: llm.with_structured_output(schema).with_config(
+            callbacks=[prompt_cache_metrics]
+        )
+        for schema in SCHEMAS
+    }
+    for tier, llm in llms.items()
+}
+
+
+llm_single_flight = SingleFlight("single_flight")
+llm_hedger = Hedger()
+
+
+class ModelRunnable(Runnable):
+    """Routes a call to its node's model tier, with coalescing and hedging.
+
+    The tier comes from the `model_tier` metadata the graph sets on each node,
+    calls made outside a node use the quality tier. Concurrent calls with the
+    same model, temperature, output schema and serialized messages share one
+    request. That request is hedged when the node is listed in HEDGED_NODES.
+    """
+
+    def __init__(self, schema: Union[Type[BaseModel], None]):
+        self.schema = schema
+        self.group = schema.__name__ if schema else "chat"
+
+    def route(self, metadata: Dict[str, Any]) -> Tuple[ModelTier, Runnable]:
+        tier: ModelTier = metadata.get("model_tier", "quality")
+        if self.schema is None:
+            return tier, chat_llms[tier]
+        return tier, structured_llms[tier][self.schema]
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs
+    ) -> Any:
+        metadata = ensure_config(config).get("metadata") or {}
+        tier, runnable = self.route(metadata)
+        with tracer.span("llm", **self.attributes(tier, metadata)):
+            return runnable.invoke(input, config, **kwargs)
+
+    def attributes(
+        self, tier: ModelTier, metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        return {
+            "model": llms[tier].model_name,
+            "tier": tier,
+            "schema": self.group,
+            "node": metadata.get("langgraph_node", "unknown"),
+        }
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs
+    ) -> Any:
+        # Set by LangGraph for the node running this call
+        metadata = ensure_config(config).get("metadata") or {}
+        tier, runnable = self.route(metadata)
+        metrics.incr(f"llm.{tier}.calls")
+        with tracer.span("llm", **self.attributes(tier, metadata)):
+            if config or kwargs:
+                return await runnable.ainvoke(input, config, **kwargs)
+
+            node = metadata.get("langgraph_node", "unknown")
+
+            def call():
+                return llm_hedger.run(node, lambda: runnable.ainvoke(input))
+
+            if not SINGLE_FLIGHT:
+                return await call()
+
+            request = {
+                "model": llms[tier].model_name,
+                "temperature": llms[tier].temperature,
+                "schema": self.group,
+                "input": dumpd(input),
+            }
+            key = hashlib.sha256(
+                json.dumps(request, sort_keys=True, default=str).encode()
+            ).hexdigest()
+            return await llm_single_flight.do(key, call, self.group)
+
+
+def get_runnable(schema: Union[Type[BaseModel], None] = None) -> Runnable:
+    """Return the runnable for a schema, or for plain chat without one.
+
+    The model is picked when it is invoked, from the tier of the calling node.
+    """
+    return ModelRunnable(schema)
+
+
+def todays_date() -> str:
+    # Day granularity keeps the prompt identical for the whole day
+    return datetime.now().strftime("%A %Y-%m-%d")
+
+
+def build_messages(
+    system_prompt: str,
+    history: Sequence[AnyMessage] = (),
+    context: Union[str, None] = None,
+    query: Union[str, None] = None,
+) -> List[AnyMessage]:
+    """Order the prompt so the provider can cache the longest prefix.
+
+    The static system prompt comes first, followed by the conversation
+    history, the per-call context (retrieved data, known details, dates) and
+    finally the user query.
+    """
+
+    messages: List[AnyMessage] = [SystemMessage(content=system_prompt)]
+    messages.extend(history)
+    if context:
+        messages.append(SystemMessage(content=context))
+    if query is not None:
+        messages.append(HumanMessage(content=query))
+    return messages
@@ -1,13 +1,35 @@
 from langchain_openai import ChatOpenAI
 from langgraph.graph.message import AnyMessage
-from utils.gene import Gene
-from utils.get_text_data import get_all_data_documents
-from typing import List, Literal, Union, Dict, NotRequired, TypedDict
+from utils.availability import AvailabilityDay
+from utils.cassette import make_chat_model
+from utils.knowledge_base import Knowledge
+from utils.tenants import TenantRegistry, current_knowledge_base
+from typing import Dict, List, Literal, Union, NotRequired, TypedDict
 from pydantic import BaseModel, Field
 from langgraph.graph import MessagesState
+import os
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0)
-gene = Gene(get_all_data_documents())
+ModelTier = Literal["fast", "quality"]
+
+# Model behind each tier, nodes declare their tier in graph.NODE_MODEL_TIERS
+MODEL_TIERS: Dict[ModelTier, str] = {
+    "fast": os.getenv("FAST_MODEL") or "gpt-4o-mini",
+    "quality": os.getenv("QUALITY_MODEL") or "gpt-4o",
+}
+llms: Dict[ModelTier, ChatOpenAI] = {
+    tier: make_chat_model(model=model, temperature=0)
+    for tier, model in MODEL_TIERS.items()
+}
+tenants = TenantRegistry()
+
+
+def current_knowledge() -> Knowledge:
+    """The Knowledge of the hospital this turn is for.
+
+    Read it once per use, a reload may replace it.
+    """
+    knowledge_base = current_knowledge_base.get() or tenants.get()
+    return knowledge_base.current
 
 
 class DoctorAvailability(BaseModel):
@@ -172,7 +194,7 @@ class HospitalSystemState(MessagesState):
     doctor: Doctor
     doctor_not_found: bool
     doctor_id: int
-    availability: List[Dict[str, str]]
+    availability: List[AvailabilityDay]
     response_type: str
     response_before: str
     response_after: str
@@ -183,6 +205,7 @@ class HospitalSystemState(MessagesState):
     confirmed_booking: bool
     next_node: str
     search_results: str
+    search_query: str
     loading_message: str
     status: Literal["stopped", "completed", "running"]
     restart_graph: bool
@@ -205,7 +228,7 @@ class NextHospitalSystemState(TypedDict):
     doctor: NotRequired[Union[Doctor, None]]
     doctor_not_found: NotRequired[bool]
     doctor_id: NotRequired[int]
-    availability: NotRequired[List[Dict[str, str]]]
+    availability: NotRequired[List[AvailabilityDay]]
     response_type: NotRequired[str]
     response_before: NotRequired[str]
     response_after: NotRequired[str]
@@ -216,6 +239,7 @@ class NextHospitalSystemState(TypedDict):
     confirmed_booking: NotRequired[bool]
     next_node: NotRequired[str]
     search_results: NotRequired[str]
+    search_query: NotRequired[str]
     loading_message: NotRequired[str]
     status: NotRequired[Literal["stopped", "completed", "running"]]
     restart_graph: NotRequired[bool]
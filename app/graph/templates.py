@@ -0,0 +1,124 @@
+from typing import List, Tuple, Union
+import os
+
+from graph.shared import HospitalSystemState
+
+
+# Nodes that render their reply from a template instead of calling the model,
+# eg TEMPLATED_RESPONSE_NODES="ask_appointment_info,book_appointment"
+TEMPLATED_NODES = {
+    node.strip()
+    for node in (os.getenv("TEMPLATED_RESPONSE_NODES") or "").split(",")
+    if node.strip()
+}
+
+
+def use_template(node: str) -> bool:
+    return node in TEMPLATED_NODES
+
+
+def _format_time(time: Union[str, None]) -> str:
+    # 10:30:00 -> 10:30
+    if time and len(time) == 8 and time.endswith(":00"):
+        return time[:5]
+    return time or ""
+
+
+def _details_table(rows: List[Tuple[str, Union[str, None]]]) -> str:
+    lines = ["| Detail | Value |", "| --- | --- |"]
+    for label, value in rows:
+        lines.append(f"| **{label}** | {value or '-'} |")
+    return "\n".join(lines)
+
+
+def _appointment_rows(state: HospitalSystemState):
+    doctor = state.get("doctor", None)
+    return [
+        ("Doctor", doctor.full_name if doctor else state.get("doctor_name")),
+        ("Date", state.get("appointment_date")),
+        (
+            "Time",
+            f"{_format_time(state.get('start_time'))} - "
+            f"{_format_time(state.get('end_time'))}",
+        ),
+        ("Full Name", state.get("patient_name")),
+        ("Email", state.get("patient_email")),
+        ("Reason", state.get("patient_reason")),
+    ]
+
+
+def render_appointment_info_request(missing_details: List[str]) -> str:
+    if not missing_details:
+        return "Thank you, I have all the details I need for your appointment."
+
+    details = "\n".join(f"- **{detail}**" for detail in missing_details)
+    message = (
+        "To complete your booking, please provide the following:\n\n"
+        f"{details}"
+    )
+    if len(missing_details) > 1:
+        message += (
+            "\n\nYou can send them all at once, for example: "
+            "*My name is Jane Doe, email: jane@doe.com, reason: headaches*."
+        )
+    return message
+
+
+def render_appointment_confirmation(state: HospitalSystemState) -> str:
+    return (
+        "### Please confirm your appointment\n\n"
+        f"{_details_table(_appointment_rows(state))}\n\n"
+        "Reply **yes** to confirm the booking, or tell me what you would "
+        "like to change."
+    )
+
+
+def booking_succeeded(response: dict) -> bool:
+    """Whether the booking API accepted the appointment.
+
+    Args:
+        response (dict): The result of `api.book_appointment`.
+    """
+
+    if "error" in response:
+        return False
+
+    status_code = response.get("status_code")
+    if status_code is not None:
+        return 200 <= status_code < 300
+
+    data = response.get("data")
+    return isinstance(data, dict) and bool(data.get("id"))
+
+
+def _booking_error(response: dict) -> str:
+    if "error" in response:
+        return str(response["error"])
+
+    data = response.get("data")
+    if isinstance(data, dict):
+        for key in ("message", "error", "detail"):
+            if data.get(key):
+                return str(data[key])
+    return "The hospital system did not accept the booking."
+
+
+def render_booking_result(state: HospitalSystemState, response: dict) -> str:
+    if not booking_succeeded(response):
+        return (
+            "### We could not book your appointment\n\n"
+            f"{_booking_error(response)}\n\n"
+            "Please try again, or let me know if you would like a "
+            "different date or doctor."
+        )
+
+    data = response.get("data", {})
+    rows = _appointment_rows(state)
+    if isinstance(data, dict) and data.get("id"):
+        rows.insert(0, ("Booking Reference", f"#{data['id']}"))
+
+    return (
+        "### Your appointment is booked\n\n"
+        f"{_details_table(rows)}\n\n"
+        "Is there anything else I can help you with?"
+    )
@@ -1,15 +1,75 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
+from fastapi import (
+    FastAPI,
+    WebSocket,
+    WebSocketDisconnect,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+)
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
-from typing import Any
+from typing import Any, Literal, Union
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
+import os
+import secrets
 
 load_dotenv()
 
-from graph.graph import build_hospital_system_graph, get_memory_config
-from db.feedback_db import FeedbackRequest, Feedback, get_db
+from graph.graph import (
+    build_hospital_system_graph,
+    get_memory_config,
+    rollback_to_checkpoint,
+    hospital_memory,
+)
+from graph.shared import tenants
+from db.feedback_db import (
+    FeedbackRequest,
+    Feedback,
+    get_db,
+    query_feedback,
+    iter_feedback,
+    get_feedback_stats,
+)
+from db.feedback_writer import feedback_writer, FeedbackQueueFull
+from utils.metrics import metrics
+from utils.connection_manager import (
+    AVAILABILITY_PAGE,
+    ConnectionManager,
+    InvalidMessage,
+    receive_message,
+)
+from utils.deadline import DeadlineExceeded, start_deadline
+from utils.availability import availability_message
+from utils.tenants import DEFAULT_TENANT, UnknownTenant, current_knowledge_base
+from utils.tracing import Span, tracer
+
+# Bearer token of the /admin endpoints, which are disabled without it
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+# Level of the app's own log records, eg DEBUG or WARNING (default INFO)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL") or "INFO",
+    format="%(levelname)s:     %(name)s: %(message)s",
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    feedback_writer.start()
+    tenants.start()
+    yield
+    await tenants.stop()
+    # Flush pending feedback before the worker exits
+    await feedback_writer.stop()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -25,22 +85,22 @@ app.add_middleware(
 graph = build_hospital_system_graph()
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+manager = ConnectionManager()
 
-    def disconnect(self, websocket: WebSocket, chat_id: str):
-        self.active_connections.remove(websocket)
+logger = logging.getLogger(__name__)
 
-    async def send(self, message: dict, websocket: WebSocket):
-        await websocket.send_json(message)
 
+async def send_page(client_id: str, page: int):
+    """Send another page of the client's last availability list.
 
-manager = ConnectionManager()
+    Served over the client's own socket, so the client id alone does not
+    give access to a conversation's state.
+    """
+    state = graph.get_state(get_memory_config(client_id))
+    await manager.send(
+        availability_message(state.values.get("availability", []), page),
+        client_id,
+    )
 
 
 async def process_event(
@@ -67,23 +127,17 @@ async def process_event(
                     "role": "system",
                     "status": "success",
                 },
-                websocket,
+                client_id,
             )
         elif response_type == "availability-list":
-            availability = event.get("availability", [])
-            message_before = event.get("response_before", "")
-            message_after = event.get("response_after", "")
-
+            # Later pages are requested over the socket, see send_page
             await manager.send(
-                {
-                    "availability": availability,
-                    "type": "availability-list",
-                    "role": "system",
-                    "status": "success",
-                    "messageBefore": message_before,
-                    "messageAfter": message_after,
-                },
-                websocket,
+                availability_message(
+                    event.get("availability", []),
+                    message_before=event.get("response_before", ""),
+                    message_after=event.get("response_after", ""),
+                ),
+                client_id,
             )
 
         elif response_type == "potential_doctors":
@@ -100,7 +154,7 @@ async def process_event(
                     "messageBefore": message_before,
                     "messageAfter": message_after,
                 },
-                websocket,
+                client_id,
             )
 
     elif status == "running" and loading_message:
@@ -110,8 +164,79 @@ async def process_event(
                 "state": "loading",
                 "message": loading_message,
             },
-            websocket,
+            client_id,
+        )
+
+
+async def run_turn(
+    websocket: WebSocket,
+    client_id: str,
+    user_message: str,
+    restart: bool,
+    span: Span,
+):
+    config = get_memory_config(client_id)
+    graph_state = graph.get_state(config)
+
+    # Every node, model call and API request of this turn shares the deadline
+    start_deadline()
+
+    try:
+        if graph_state.next and not restart:
+            graph.update_state(
+                config, {"query": user_message, "status": "running"}
+            )
+            async for event in graph.astream(
+                None,
+                config,
+                stream_mode="values",
+            ):
+                await process_event(event, manager, websocket, client_id)
+
+        else:
+            # Process the LLM invocation asynchronously
+            async for event in graph.astream(
+                {"query": user_message, "status": "running"},
+                config,
+                stream_mode="values",
+            ):
+                await process_event(event, manager, websocket, client_id)
+
+    except asyncio.CancelledError as e:
+        # Superseded by a newer message or the client disconnected
+        span.record_error(e)
+        rollback_to_checkpoint(graph, graph_state)
+        raise
+    except DeadlineExceeded as e:
+        # Keep the previous state so the same message can be sent again
+        span.record_error(e)
+        rollback_to_checkpoint(graph, graph_state)
+        await manager.send(
+            {
+                "message": "Sorry, this is taking longer than expected. "
+                "Please send your message again.",
+                "type": "chat-message",
+                "role": "system",
+                "status": "error",
+            },
+            client_id,
         )
+    except Exception as e:
+        metrics.incr("turns.failed")
+        logger.exception("turn failed for %s", client_id)
+        span.record_error(e)
+        rollback_to_checkpoint(graph, graph_state)
+        await manager.send(
+            {
+                "message": "Something went wrong, please try again.",
+                "type": "chat-message",
+                "role": "system",
+                "status": "error",
+            },
+            client_id,
+        )
+    finally:
+        tracer.end_span(span)
 
 
 @app.get("/health")
@@ -119,10 +244,67 @@ def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+def get_metrics():
+    return {"status": "success", "data": metrics.snapshot()}
+
+
+def require_admin(authorization: Union[str, None] = Header(None)):
+    """Allow requests sending `Authorization: Bearer <ADMIN_TOKEN>`.
+
+    Admin endpoints are disabled when ADMIN_TOKEN is not set.
+    """
+
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not authorization or not secrets.compare_digest(
+        authorization, f"Bearer {ADMIN_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+# Checkpoints kept per conversation and their serialized size, read on the
+# event loop where the graph writes them. Thread ids are the client ids of
+# live sessions, so only admins may list them.
+@app.get("/debug/checkpoints", dependencies=[Depends(require_admin)])
+async def get_checkpoint_sizes():
+    sizes = hospital_memory.sizes()
+    return {
+        "status": "success",
+        "data": {
+            "retention": hospital_memory.retention,
+            "total_bytes": sum(size["bytes"] for size in sizes.values()),
+            "threads": sizes,
+        },
+    }
+
+
+# Rebuild the knowledge base of a tenant from its data files, searches keep
+# using the previous one until the new index is ready
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def reload_knowledge_base(tenant: str = DEFAULT_TENANT):
+    try:
+        knowledge_base = await tenants.aget(tenant)
+    except UnknownTenant as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    try:
+        knowledge = await knowledge_base.reload()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+
+    return {
+        "status": "success",
+        "data": {
+            "tenant": tenant,
+            "version": knowledge.version,
+            "documents": knowledge.gene.vector_store.index.ntotal,
+        },
+    }
+
+
 @app.post("/feedback")
-async def submit_feedback(
-    feedback_data: FeedbackRequest, db: Session = Depends(get_db)
-):
+async def submit_feedback(feedback_data: FeedbackRequest):
     # Create feedback object
     feedback_entry = Feedback(
         feedback=feedback_data.feedback,
@@ -133,62 +315,125 @@ async def submit_feedback(
         message=feedback_data.message,
         user_message=feedback_data.user_message,
     )
-    db.add(feedback_entry)
-    db.commit()
-    db.refresh(feedback_entry)
-    return {"status": "success", "data": feedback_entry.id}
+
+    # Batched with other feedback and written off the event loop
+    try:
+        feedback_id = await feedback_writer.submit(feedback_entry)
+    except FeedbackQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"status": "success", "data": feedback_id}
 
 
-# GET endpoint to retrieve all feedback
+# GET endpoint to retrieve feedback, one page at a time or as an NDJSON export
 @app.get("/feedback")
-async def get_feedback(db: Session = Depends(get_db)):
-    feedback_list = db.query(Feedback).all()
-    return {"status": "success", "data": [f.__dict__ for f in feedback_list]}
+def get_feedback(
+    cursor: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    message_type: str | None = None,
+    feedback: str | None = None,
+    response_format: Literal["json", "ndjson"] = Query("json", alias="format"),
+    db: Session = Depends(get_db),
+):
+    if response_format == "ndjson":
+        # The session from get_db is closed before the body is streamed
+        def export():
+            for chunk in iter_feedback(message_type, feedback):
+                yield "".join(json.dumps(row) + "\n" for row in chunk)
+
+        return StreamingResponse(export(), media_type="application/x-ndjson")
 
+    # Fetch one extra row to know if there is a next page
+    rows = query_feedback(db, cursor, limit + 1, message_type, feedback)
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
 
+    return {
+        "status": "success",
+        "data": [row.to_dict() for row in rows[:limit]],
+        "next_cursor": next_cursor,
+    }
+
+
+# Precomputed counters, independent of the size of the feedback table
+@app.get("/feedback/stats")
+def feedback_stats(days: int = Query(7, ge=1, le=366)):
+    return {"status": "success", "data": get_feedback_stats(days)}
+
+
+# Pages of the availability last sent to the client
 @app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
+async def websocket_endpoint(
+    websocket: WebSocket, client_id: str, tenant: str = DEFAULT_TENANT
+):
+    # The hospital is picked once per connection, loading its index if needed
+    try:
+        await tenants.aget(tenant)
+    except UnknownTenant:
+        await websocket.close(code=1008)
+        return
+
     await manager.connect(websocket, client_id)
     try:
         while True:
             # Receive message from the client
-            user_json = await websocket.receive_json()
+            try:
+                user_json = await receive_message(websocket)
+            except InvalidMessage as e:
+                metrics.incr("ws.invalid_messages")
+                await manager.send(
+                    {
+                        "message": f"Invalid message: {e}",
+                        "type": "chat-message",
+                        "role": "system",
+                        "status": "error",
+                    },
+                    client_id,
+                )
+                continue
+
+            if user_json.get("type") == AVAILABILITY_PAGE:
+                await send_page(client_id, user_json["page"])
+                continue
+
             user_message = user_json["message"]
             should_restart = user_json.get("restart", False)
 
-            # Send loading state to the client immediately
-            await manager.send(
-                {
-                    "type": "loading-state",
-                    "state": "loading",
-                    "message": "Thinking...",
-                },
-                websocket,
+            # Every span of the turn belongs to this trace, and its id is
+            # sent with each message of the turn
+            turn_span = tracer.start_span(
+                "turn", client_id=client_id, tenant=tenant
             )
+            with tracer.activate(turn_span):
+                # Send loading state to the client immediately
+                await manager.send(
+                    {
+                        "type": "loading-state",
+                        "state": "loading",
+                        "message": "Thinking...",
+                    },
+                    client_id,
+                )
 
-            config = get_memory_config(client_id)
-            graph_state = graph.get_state(config)
+                # Nodes read the tenant from the context the turn task
+                # copies. Looking it up again keeps it recently used, or
+                # reloads it after an eviction.
+                knowledge_base = await tenants.aget(tenant)
+                current_knowledge_base.set(knowledge_base)
 
-            if graph_state.next and not should_restart:
-                graph.update_state(
-                    config, {"query": user_message, "status": "running"}
+                # A new message or restart cancels the turn still running
+                await manager.start_turn(
+                    client_id,
+                    run_turn(
+                        websocket,
+                        client_id,
+                        user_message,
+                        should_restart,
+                        turn_span,
+                    ),
                 )
-                async for event in graph.astream(
-                    None,
-                    config,
-                    stream_mode="values",
-                ):
-                    await process_event(event, manager, websocket, client_id)
-
-            else:
-                # Process the LLM invocation asynchronously
-                async for event in graph.astream(
-                    {"query": user_message, "status": "running"},
-                    config,
-                    stream_mode="values",
-                ):
-                    await process_event(event, manager, websocket, client_id)
 
     except WebSocketDisconnect:
-        print("websocket disconnected")
+        metrics.incr("ws.disconnects")
+    finally:
+        # Also stops the writer and the running turn when the handler fails
         manager.disconnect(websocket, client_id)
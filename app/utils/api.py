@@ -1,14 +1,39 @@
-import requests
+import httpx
 import os
 from typing import Union
 
+from utils.deadline import time_left
+from utils.tracing import tracer
+
 MOCK_HOSPITAL_SYSTEM_BASE_URL = (
     os.getenv("MOCK_HOSPITAL_SYSTEM_BASE_URL")
     or "https://mock-hospital-system.onrender.com"
 )
 
 
-def search_doctor_by_name(name: str) -> dict:
+# Used outside of a turn, when there is no deadline
+DEFAULT_TIMEOUT = 10.0
+
+
+def _client() -> httpx.AsyncClient:
+    # Async so a cancelled turn also cancels its pending request
+    return httpx.AsyncClient(
+        follow_redirects=True, timeout=time_left(DEFAULT_TIMEOUT)
+    )
+
+
+async def _request(
+    name: str, method: str, url: str, **kwargs
+) -> httpx.Response:
+    # Query parameters and bodies hold patient details, keep them out of spans
+    with tracer.span(f"api.{name}", method=method, url=url) as span:
+        async with _client() as client:
+            res = await client.request(method, url, **kwargs)
+        span.set_attribute("status_code", res.status_code)
+        return res
+
+
+async def search_doctor_by_name(name: str) -> dict:
     """Search for a doctor by name in the mock hospital system.
 
     Args:
@@ -21,13 +46,15 @@ def search_doctor_by_name(name: str) -> dict:
     url = f"{MOCK_HOSPITAL_SYSTEM_BASE_URL}/api/doctors/search"
     query_string = {"name": name}
     try:
-        res = requests.get(url, params=query_string)
+        res = await _request(
+            "search_doctor_by_name", "GET", url, params=query_string
+        )
         return res.json()
     except Exception as e:
         return {"error": str(e)}
 
 
-def check_doctor_availabity(
+async def check_doctor_availabity(
     doctor_name: str, start_date: str, end_date: str
 ) -> dict:
     """Check the availability of a doctor in the mock hospital system.
@@ -47,7 +74,7 @@ def check_doctor_availabity(
     if not end_date:
         return {"error": "End date cannot be empty"}
 
-    doctor = search_doctor_by_name(doctor_name)
+    doctor = await search_doctor_by_name(doctor_name)
 
     if "error" in doctor:
         return doctor
@@ -59,7 +86,9 @@ def check_doctor_availabity(
     url = f"{MOCK_HOSPITAL_SYSTEM_BASE_URL}/api/availability/{doctor_id}"
     query_string = {"startDate": start_date, "endDate": end_date}
     try:
-        res = requests.get(url, params=query_string)
+        res = await _request(
+            "check_doctor_availabity", "GET", url, params=query_string
+        )
         return {
             "doctor_id": doctor[0]["id"],
             "availability": res.json(),
@@ -68,7 +97,7 @@ def check_doctor_availabity(
         return {"error": str(e)}
 
 
-def book_appointment(
+async def book_appointment(
     doctor_id: int,
     patient_name: str,
     email: str,
@@ -76,6 +105,7 @@ def book_appointment(
     start_time: str,
     end_time: str,
     reason: Union[str, None] = None,
+    idempotency_key: Union[str, None] = None,
 ) -> dict:
     """Book an appointment with a doctor in the mock hospital system.
 
@@ -87,6 +117,8 @@ def book_appointment(
         start_time (str): The start time of the appointment.
         end_time (str): The end time of the appointment.
         status (str): The status of the appointment.
+        idempotency_key (str, optional): Sent as `Idempotency-Key`, the same
+            key for every attempt of one booking.
     """
 
     if not doctor_id:
@@ -119,8 +151,13 @@ def book_appointment(
         "reason": reason,
     }
     headers = {"Content-Type": "application/json"}
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
     try:
-        res = requests.post(url, json=payload, headers=headers)
-        return {"data": res.json()}
+        res = await _request(
+            "book_appointment", "POST", url, json=payload, headers=headers
+        )
+        # Rejected bookings also have a JSON body, the status tells them apart
+        return {"data": res.json(), "status_code": res.status_code}
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,180 @@
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, TypedDict, Union, cast
+import json
+import logging
+import math
+import os
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Days of availability per page, for the prompt and the client payload
+AVAILABILITY_PAGE_DAYS = int(os.getenv("AVAILABILITY_PAGE_DAYS") or 7)
+
+# Fields of a slot from the hospital system, named like the appointmentDate,
+# startTime and endTime of its appointments. The times may also be full ISO
+# datetimes, which carry the date.
+DATE_KEY = "date"
+START_KEY = "startTime"
+END_KEY = "endTime"
+
+
+class TimeRange(TypedDict):
+    start: str
+    end: str
+
+
+class AvailabilityDay(TypedDict):
+    date: str
+    slots: List[TimeRange]
+
+
+class AvailabilityPage(TypedDict):
+    days: List[AvailabilityDay]
+    page: int
+    total_pages: int
+
+
+def _is_open(slot: Dict[str, Any]) -> bool:
+    if slot.get("isAvailable") is False or slot.get("isBooked") is True:
+        return False
+    return slot.get("status") not in ("booked", "unavailable", "cancelled")
+
+
+def _split_datetime(value: str) -> Tuple[str, str]:
+    # 2024-11-18T09:00:00 -> 2024-11-18, 09:00:00
+    date, _, time = value.replace(" ", "T").partition("T")
+    return date, time[:8]
+
+
+def _parse_slot(slot: Dict[str, Any]) -> Union[Tuple[str, TimeRange], None]:
+    start = slot.get(START_KEY)
+    end = slot.get(END_KEY)
+    date = slot.get(DATE_KEY)
+    if not isinstance(start, str) or not isinstance(end, str):
+        return None
+    if "T" in start or " " in start:
+        date, start = _split_datetime(start)
+        end = _split_datetime(end)[1]
+    if not isinstance(date, str) or not date:
+        return None
+    return date[:10], {"start": start, "end": end}
+
+
+def compact_availability(availability: Any) -> List[AvailabilityDay]:
+    """Group open slots by day and merge contiguous or overlapping ones.
+
+    Slots that do not match the expected fields are counted as
+    `availability.unrecognized_slots`. When no slot is recognized, the raw
+    open slots are returned unchanged rather than reporting no availability.
+
+    Args:
+        availability (Any): The slots returned by the hospital system.
+
+    Returns:
+        List[AvailabilityDay]: The days in order, each with its time ranges.
+    """
+
+    if not isinstance(availability, list):
+        return []
+
+    days: Dict[str, List[TimeRange]] = {}
+    unrecognized: List[Any] = []
+    for slot in availability:
+        if isinstance(slot, dict) and not _is_open(slot):
+            continue
+
+        parsed = _parse_slot(slot) if isinstance(slot, dict) else None
+        if parsed is None:
+            unrecognized.append(slot)
+            continue
+
+        date, time_range = parsed
+        days.setdefault(date, []).append(time_range)
+
+    if unrecognized:
+        metrics.incr("availability.unrecognized_slots", len(unrecognized))
+        logger.warning(
+            "%d availability slots not recognized, eg %s",
+            len(unrecognized),
+            json.dumps(unrecognized[0], default=str),
+        )
+        if not days:
+            # The raw slots, shown as they are
+            return cast(List[AvailabilityDay], unrecognized)
+
+    compacted: List[AvailabilityDay] = []
+    for date in sorted(days):
+        merged: List[TimeRange] = []
+        for slot in sorted(days[date], key=lambda s: s["start"]):
+            if merged and slot["start"] <= merged[-1]["end"]:
+                merged[-1]["end"] = max(merged[-1]["end"], slot["end"])
+            else:
+                merged.append(dict(slot))
+        compacted.append({"date": date, "slots": merged})
+
+    return compacted
+
+
+def paginate_availability(
+    days: List[AvailabilityDay],
+    page: int = 1,
+    page_size: int = AVAILABILITY_PAGE_DAYS,
+) -> AvailabilityPage:
+    total_pages = max(math.ceil(len(days) / page_size), 1)
+    page = min(max(page, 1), total_pages)
+    start = (page - 1) * page_size
+
+    return {
+        "days": days[start : start + page_size],
+        "page": page,
+        "total_pages": total_pages,
+    }
+
+
+def availability_message(
+    availability: List[AvailabilityDay],
+    page: int = 1,
+    message_before: str = "",
+    message_after: str = "",
+) -> dict:
+    """The availability-list message sent to the client for one page."""
+    days = paginate_availability(availability, page)
+    return {
+        "availability": days["days"],
+        "page": days["page"],
+        "totalPages": days["total_pages"],
+        "type": "availability-list",
+        "role": "system",
+        "status": "success",
+        "messageBefore": message_before,
+        "messageAfter": message_after,
+    }
+
+
+def _format_time(time: str) -> str:
+    # 09:00:00 -> 09:00
+    return time[:5]
+
+
+def format_availability(days: List[AvailabilityDay]) -> str:
+    """One line per day for the prompt, eg `Mon 2024-11-18: 09:00-12:00`."""
+    lines = []
+    for day in days:
+        if not isinstance(day, dict) or "slots" not in day:
+            # A raw slot kept by compact_availability
+            lines.append(json.dumps(day, default=str))
+            continue
+        try:
+            weekday = datetime.strptime(day["date"], "%Y-%m-%d").strftime(
+                "%a "
+            )
+        except ValueError:
+            weekday = ""
+        ranges = ", ".join(
+            f"{_format_time(s['start'])}-{_format_time(s['end'])}"
+            for s in day["slots"]
+        )
+        lines.append(f"{weekday}{day['date']}: {ranges}")
+    return "\n".join(lines)
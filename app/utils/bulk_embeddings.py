@@ -0,0 +1,218 @@
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from typing import Dict, Iterable, Iterator, List, Set, Union
+import hashlib
+import logging
+import numpy as np
+import openai
+import os
+import random
+import shutil
+import threading
+import time
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE") or 100)
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY") or 4)
+# Tokens per minute allowed for the embeddings model
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM") or 1_000_000)
+EMBEDDING_MAX_RETRIES = 6
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class TokenRateLimiter:
+    """Token bucket refilled continuously at `tokens_per_minute`."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.tokens = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        # A batch larger than the bucket waits for a full bucket
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate,
+                )
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def estimate_tokens(text: str) -> int:
+    # About 4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def batched(docs: Iterable[Document], size: int) -> Iterator[List[Document]]:
+    batch: List[Document] = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BulkEmbedder:
+    """Embed a corpus in concurrent, rate limited and resumable batches.
+
+    Every finished batch is saved under `checkpoint_dir` keyed by the hash of
+    each document's content, so an interrupted build only embeds what is
+    missing when it runs again.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        checkpoint_dir: str,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        tokens_per_minute: int = EMBEDDING_TPM,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+    ):
+        self.embeddings = embeddings
+        self.checkpoint_dir = checkpoint_dir
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.limiter = TokenRateLimiter(tokens_per_minute)
+        self.max_retries = max_retries
+
+    def load_checkpoint(self) -> Dict[str, np.ndarray]:
+        vectors: Dict[str, np.ndarray] = {}
+        if not os.path.isdir(self.checkpoint_dir):
+            return vectors
+
+        for name in os.listdir(self.checkpoint_dir):
+            if not name.endswith(".npz"):
+                continue
+            with np.load(os.path.join(self.checkpoint_dir, name)) as batch:
+                vectors.update(zip(batch["hashes"], batch["vectors"]))
+        return vectors
+
+    def save_batch(self, hashes: List[str], vectors: List[List[float]]):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        name = content_hash("".join(hashes))
+        path = os.path.join(self.checkpoint_dir, f"{name}.npz")
+        # Written under a temporary name so a crash never leaves half a file
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            hashes=np.array(hashes),
+            vectors=np.array(vectors, dtype=np.float32),
+        )
+        os.replace(tmp_path, path)
+
+    def embed_batch(self, batch: List[Document]) -> List[List[float]]:
+        texts = [doc.page_content for doc in batch]
+        self.limiter.acquire(sum(estimate_tokens(text) for text in texts))
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(2**attempt, 60) * (1 + random.random())
+                metrics.incr("embeddings.retries")
+                logger.warning(
+                    "embedding batch failed (%s), retry in %.1fs", e, delay
+                )
+                time.sleep(delay)
+
+        self.save_batch([content_hash(text) for text in texts], vectors)
+        return vectors
+
+    def embed(
+        self,
+        docs: Iterable[Document],
+        known: Union[Dict[str, np.ndarray], None] = None,
+    ) -> List[List[float]]:
+        """Return the embedding of every document, in order.
+
+        Documents are read lazily and at most `concurrency` batches beyond
+        the ones being embedded wait in memory, so a large corpus is never
+        held at once. Only the content hashes of the documents are kept.
+
+        Args:
+            docs (Iterable[Document]): The documents to embed, streamed in
+                batches of `batch_size`.
+            known (Dict[str, np.ndarray], optional): Vectors already known by
+                content hash, eg from the index being rebuilt.
+        """
+
+        done = {**(known or {}), **self.load_checkpoint()}
+        hashes: List[str] = []
+        queued: Set[str] = set()
+
+        def missing() -> Iterator[Document]:
+            for doc in docs:
+                key = content_hash(doc.page_content)
+                hashes.append(key)
+                if key not in done and key not in queued:
+                    queued.add(key)
+                    yield doc
+
+        started = time.perf_counter()
+        embedded = 0
+        pending: Dict[Future, List[Document]] = {}
+
+        def collect(finished: Iterable[Future]):
+            nonlocal embedded
+            for future in finished:
+                batch = pending.pop(future)
+                for doc, vector in zip(batch, future.result()):
+                    done[content_hash(doc.page_content)] = np.array(vector)
+                embedded += len(batch)
+                metrics.incr("embeddings.documents", len(batch))
+                logger.info("embedded %d documents", embedded)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch in batched(missing(), self.batch_size):
+                # Wait for a batch to finish before reading further
+                if len(pending) >= 2 * self.concurrency:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                pending[executor.submit(self.embed_batch, batch)] = batch
+            collect(list(wait(pending).done))
+
+        logger.info(
+            "embedded %d documents, %d already embedded",
+            embedded,
+            len(hashes) - embedded,
+        )
+        metrics.observe("embeddings.build", time.perf_counter() - started)
+        return [done[key].tolist() for key in hashes]
+
+    def clear_checkpoint(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
@@ -0,0 +1,251 @@
+from collections import defaultdict
+from langchain_core.messages import (
+    AnyMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from typing import Any, Dict, List, Literal, Optional, Set, Union, cast
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from utils.metrics import metrics
+
+CassetteMode = Literal["record", "replay"]
+
+# Record model responses to CASSETTE_PATH, or serve them back from it
+CASSETTE_MODE = cast(
+    Union[CassetteMode, None], os.getenv("CASSETTE_MODE") or None
+)
+CASSETTE_PATH = os.getenv("CASSETTE_PATH") or "cassettes/default.jsonl"
+# "recorded" waits as long as the original call did, a number waits that many
+# seconds instead
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY") or "recorded"
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+def request_hash(request: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(request, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class Cassette:
+    """Model responses stored in a JSON lines file, keyed by request hash.
+
+    Replay looks requests up by the hash of the full request. Prompts embed
+    today's date, so a chat request missing from the cassette falls back to
+    the next unused response recorded for the same model, tools and
+    parameters, in recording order.
+    """
+
+    def __init__(
+        self,
+        path: str = CASSETTE_PATH,
+        mode: Union[CassetteMode, None] = CASSETTE_MODE,
+        latency: str = CASSETTE_LATENCY,
+    ):
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        self.by_shape: Dict[str, List[dict]] = defaultdict(list)
+        self.used: Set[int] = set()
+
+        if mode == "replay":
+            with open(path, "r") as file:
+                for line in file:
+                    entry = json.loads(line)
+                    self.entries[entry["key"]] = entry
+                    if entry.get("shape"):
+                        self.by_shape[entry["shape"]].append(entry)
+        elif mode == "record":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def delay(self, entry: dict) -> float:
+        if self.latency == "recorded":
+            delay = entry["latency"]
+        else:
+            delay = float(self.latency)
+        metrics.observe("cassette.replay", delay)
+        return delay
+
+    def find(self, key: str, shape: Union[str, None] = None) -> dict:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                metrics.incr("cassette.hit")
+            elif shape:
+                unused = (
+                    e for e in self.by_shape[shape] if id(e) not in self.used
+                )
+                entry = next(unused, None)
+                if entry:
+                    metrics.incr("cassette.fallback")
+
+            if entry:
+                self.used.add(id(entry))
+                return entry
+
+        metrics.incr("cassette.miss")
+        raise CassetteMiss(f"No recorded response for request {key[:12]}")
+
+    def save(self, entry: dict):
+        with self.lock:
+            self.entries[entry["key"]] = entry
+            with open(self.path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+
+
+_cassette: Union[Cassette, None] = None
+
+
+def get_cassette() -> Cassette:
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette()
+    return _cassette
+
+
+class CassetteChatOpenAI(ChatOpenAI):
+    """ChatOpenAI that records its responses or replays recorded ones."""
+
+    def _keys(self, messages, stop, kwargs):
+        payload = self._get_request_payload(messages, stop=stop, **kwargs)
+        shape = {k: v for k, v in payload.items() if k != "messages"}
+        return request_hash(payload), request_hash(shape)
+
+    def _replayed(self, entry: dict) -> ChatResult:
+        message = messages_from_dict([entry["response"]["message"]])[0]
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output=entry["response"]["llm_output"],
+        )
+
+    def _entry(self, key, shape, result: ChatResult, latency: float):
+        return {
+            "kind": "chat",
+            "key": key,
+            "shape": shape,
+            "latency": latency,
+            "response": {
+                "message": message_to_dict(result.generations[0].message),
+                "llm_output": result.llm_output,
+            },
+        }
+
+    def _generate(
+        self,
+        messages: List[AnyMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cassette = get_cassette()
+        key, shape = self._keys(messages, stop, kwargs)
+        if cassette.mode == "replay":
+            entry = cassette.find(key, shape)
+            time.sleep(cassette.delay(entry))
+            return self._replayed(entry)
+
+        started = time.perf_counter()
+        result = super()._generate(messages, stop, run_manager, **kwargs)
+        latency = time.perf_counter() - started
+        metrics.observe("cassette.record", latency)
+        cassette.save(self._entry(key, shape, result, latency))
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[AnyMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cassette = get_cassette()
+        key, shape = self._keys(messages, stop, kwargs)
+        if cassette.mode == "replay":
+            entry = cassette.find(key, shape)
+            await asyncio.sleep(cassette.delay(entry))
+            return self._replayed(entry)
+
+        started = time.perf_counter()
+        result = await super()._agenerate(
+            messages, stop, run_manager, **kwargs
+        )
+        latency = time.perf_counter() - started
+        metrics.observe("cassette.record", latency)
+        cassette.save(self._entry(key, shape, result, latency))
+        return result
+
+
+class CassetteOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings that records its vectors or replays recorded ones.
+
+    Texts are keyed one by one, so a batch is replayed even when it was
+    recorded split differently.
+    """
+
+    def _key(self, text: str) -> str:
+        return request_hash({"model": self.model, "input": text})
+
+    def embed_documents(
+        self, texts: List[str], chunk_size: Optional[int] = None
+    ) -> List[List[float]]:
+        cassette = get_cassette()
+        keys = [self._key(text) for text in texts]
+        if cassette.mode == "replay":
+            entries = [cassette.find(key) for key in keys]
+            time.sleep(max((cassette.delay(e) for e in entries), default=0))
+            return [entry["response"] for entry in entries]
+
+        started = time.perf_counter()
+        vectors = super().embed_documents(texts, chunk_size)
+        latency = time.perf_counter() - started
+        metrics.observe("cassette.record", latency)
+        for key, vector in zip(keys, vectors):
+            cassette.save(
+                {
+                    "kind": "embedding",
+                    "key": key,
+                    "latency": latency,
+                    "response": vector,
+                }
+            )
+        return vectors
+
+    async def aembed_documents(
+        self, texts: List[str], chunk_size: Optional[int] = None
+    ) -> List[List[float]]:
+        return await asyncio.to_thread(
+            self.embed_documents, texts, chunk_size
+        )
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def make_chat_model(**kwargs: Any) -> ChatOpenAI:
+    """A ChatOpenAI, going through the cassette when CASSETTE_MODE is set."""
+    if CASSETTE_MODE:
+        return CassetteChatOpenAI(**kwargs)
+    return ChatOpenAI(**kwargs)
+
+
+def make_embeddings(**kwargs: Any) -> OpenAIEmbeddings:
+    """An OpenAIEmbeddings, going through the cassette when it is enabled."""
+    if CASSETTE_MODE:
+        return CassetteOpenAIEmbeddings(**kwargs)
+    return OpenAIEmbeddings(**kwargs)
@@ -0,0 +1,248 @@
+from fastapi import WebSocket, WebSocketDisconnect
+from typing import Coroutine, Dict, List, Union
+import asyncio
+import json
+import logging
+import msgpack
+
+from utils.metrics import metrics
+from utils.tracing import current_trace_id
+
+logger = logging.getLogger(__name__)
+
+LOADING_STATE = "loading-state"
+# Sent by the client for another page of the last availability list
+AVAILABILITY_PAGE = "availability-page"
+
+# Requested by clients in Sec-WebSocket-Protocol to exchange MessagePack
+# binary frames, JSON text frames are used otherwise
+MSGPACK_PROTOCOL = "msgpack"
+
+# Closed because the client does not read fast enough
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class InvalidMessage(Exception):
+    """A client frame that is not a valid chat message."""
+
+
+async def receive_message(websocket: WebSocket) -> dict:
+    """Receive a JSON text frame or a MessagePack binary frame.
+
+    Raises `InvalidMessage` when the frame does not decode to a chat message
+    with a string `message`, or to an availability page request with a
+    positive `page`. The connection stays usable.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+
+    try:
+        if message.get("bytes") is not None:
+            payload = msgpack.unpackb(message["bytes"])
+        else:
+            payload = json.loads(message.get("text") or "")
+    except (ValueError, msgpack.UnpackException) as e:
+        raise InvalidMessage("Could not decode the message") from e
+
+    if not isinstance(payload, dict):
+        raise InvalidMessage("Expected an object")
+    if payload.get("type") == AVAILABILITY_PAGE:
+        page = payload.get("page")
+        if not isinstance(page, int) or isinstance(page, bool) or page < 1:
+            raise InvalidMessage("Expected a positive integer page")
+    elif not isinstance(payload.get("message"), str):
+        raise InvalidMessage("Expected an object with a string message")
+    return payload
+
+
+class Connection:
+    """A WebSocket with a bounded outbound queue drained by a writer task.
+
+    Graph execution only enqueues messages, so a slow client never blocks it.
+    Consecutive loading states that have not been sent yet are coalesced into
+    the latest one.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        max_queue_size: int,
+        send_timeout: float,
+        binary: bool = False,
+    ):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.binary = binary
+        self.send_timeout = send_timeout
+        self.queue: asyncio.Queue[Union[dict, List[dict], None]] = (
+            asyncio.Queue(maxsize=max_queue_size)
+        )
+        # The loading state waiting at the tail of the queue, if any
+        self.pending_loading_state: Union[List[dict], None] = None
+        self.closed = False
+        self.closing: Union[asyncio.Task, None] = None
+        # The graph run for the latest user message
+        self.turn: Union[asyncio.Task, None] = None
+        self.writer = asyncio.create_task(self.write())
+
+    def enqueue(self, message: dict) -> bool:
+        """Queue a message, returns False if the client fell behind."""
+        if self.closed:
+            return False
+
+        if message.get("type") == LOADING_STATE:
+            if self.pending_loading_state is not None:
+                self.pending_loading_state[0] = message
+                metrics.incr("ws.coalesced_loading_states")
+                return True
+            item: Union[dict, List[dict]] = [message]
+        else:
+            item = message
+
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            return False
+
+        self.pending_loading_state = item if isinstance(item, list) else None
+        return True
+
+    async def write(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+
+            if isinstance(item, list):
+                if item is self.pending_loading_state:
+                    self.pending_loading_state = None
+                message = item[0]
+            else:
+                message = item
+
+            try:
+                await asyncio.wait_for(self.send(message), self.send_timeout)
+            except asyncio.TimeoutError:
+                self.close_slow_consumer()
+                return
+            except Exception as e:
+                logger.warning(
+                    "websocket send failed for %s: %s", self.client_id, e
+                )
+                self.closed = True
+                return
+
+    async def send(self, message: dict):
+        if self.binary:
+            await self.websocket.send_bytes(msgpack.packb(message))
+        else:
+            await self.websocket.send_json(message)
+
+    def close_slow_consumer(self):
+        """Drop the client, the receive loop then sees the disconnect."""
+        if self.closing:
+            return
+
+        metrics.incr("ws.slow_consumer_disconnects")
+        logger.warning(
+            "disconnecting slow websocket consumer %s", self.client_id
+        )
+        self.closing = asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        writer = self.writer
+        self.close()
+        if writer is not asyncio.current_task():
+            await asyncio.gather(writer, return_exceptions=True)
+        try:
+            await asyncio.wait_for(
+                self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE),
+                self.send_timeout,
+            )
+        except Exception:
+            pass
+
+    def cancel_turn(self) -> Union[asyncio.Task, None]:
+        if self.turn and not self.turn.done():
+            self.turn.cancel()
+            metrics.incr("turns.cancelled")
+            return self.turn
+        return None
+
+    def close(self):
+        self.cancel_turn()
+        if self.closed:
+            return
+        self.closed = True
+        self.writer.cancel()
+
+
+class ConnectionManager:
+    def __init__(self, max_queue_size: int = 64, send_timeout: float = 10.0):
+        self.max_queue_size = max_queue_size
+        self.send_timeout = send_timeout
+        self.active_connections: Dict[str, Connection] = {}
+
+    async def connect(self, websocket: WebSocket, client_id: str):
+        # JSON stays the default unless the client asks for MessagePack
+        subprotocol = None
+        if MSGPACK_PROTOCOL in websocket.scope.get("subprotocols", []):
+            subprotocol = MSGPACK_PROTOCOL
+        await websocket.accept(subprotocol=subprotocol)
+        metrics.incr(f"ws.protocol.{subprotocol or 'json'}")
+
+        # A reconnecting client replaces its previous socket
+        previous = self.active_connections.get(client_id)
+        if previous:
+            previous.close()
+
+        self.active_connections[client_id] = Connection(
+            websocket,
+            client_id,
+            self.max_queue_size,
+            self.send_timeout,
+            binary=subprotocol == MSGPACK_PROTOCOL,
+        )
+        metrics.set("ws.active_connections", len(self.active_connections))
+
+    def disconnect(self, websocket: WebSocket, client_id: str):
+        connection = self.active_connections.get(client_id)
+        if connection and connection.websocket is websocket:
+            del self.active_connections[client_id]
+            connection.close()
+        metrics.set("ws.active_connections", len(self.active_connections))
+
+    async def send(self, message: dict, client_id: str):
+        connection = self.active_connections.get(client_id)
+        if not connection:
+            return
+
+        # Lets a user's report be matched to the trace of the turn
+        trace_id = current_trace_id()
+        if trace_id:
+            message = {**message, "traceId": trace_id}
+
+        if not connection.enqueue(message) and not connection.closed:
+            connection.close_slow_consumer()
+
+    async def start_turn(self, client_id: str, turn: Coroutine):
+        """Run `turn` as the client's only turn, cancelling the previous one.
+
+        Args:
+            client_id (str): The client the turn belongs to.
+            turn (Coroutine): The graph run for the new message.
+        """
+
+        connection = self.active_connections.get(client_id)
+        if not connection:
+            turn.close()
+            return
+
+        previous = connection.cancel_turn()
+        if previous:
+            # Wait for the previous turn to roll back its checkpoints
+            await asyncio.gather(previous, return_exceptions=True)
+
+        connection.turn = asyncio.create_task(turn)
@@ -0,0 +1,394 @@
+from datetime import date, timedelta
+from typing import List, NotRequired, Tuple, TypedDict, Union
+import re
+
+
+MONTHS = {
+    "jan": 1,
+    "january": 1,
+    "feb": 2,
+    "february": 2,
+    "mar": 3,
+    "march": 3,
+    "apr": 4,
+    "april": 4,
+    "may": 5,
+    "jun": 6,
+    "june": 6,
+    "jul": 7,
+    "july": 7,
+    "aug": 8,
+    "august": 8,
+    "sep": 9,
+    "sept": 9,
+    "september": 9,
+    "oct": 10,
+    "october": 10,
+    "nov": 11,
+    "november": 11,
+    "dec": 12,
+    "december": 12,
+}
+
+WEEKDAYS = {
+    "mon": 0,
+    "monday": 0,
+    "tue": 1,
+    "tues": 1,
+    "tuesday": 1,
+    "wed": 2,
+    "wednesday": 2,
+    "thu": 3,
+    "thur": 3,
+    "thurs": 3,
+    "thursday": 3,
+    "fri": 4,
+    "friday": 4,
+    "sat": 5,
+    "saturday": 5,
+    "sun": 6,
+    "sunday": 6,
+}
+
+# Words that may surround a date or time without changing its meaning.
+# Anything else left in the query makes the parse incomplete.
+FILLER_WORDS = {
+    "a",
+    "about",
+    "an",
+    "and",
+    "any",
+    "appointment",
+    "around",
+    "at",
+    "availability",
+    "available",
+    "be",
+    "between",
+    "book",
+    "can",
+    "check",
+    "date",
+    "day",
+    "do",
+    "for",
+    "from",
+    "how",
+    "i",
+    "in",
+    "is",
+    "it",
+    "let's",
+    "lets",
+    "like",
+    "maybe",
+    "me",
+    "of",
+    "ok",
+    "okay",
+    "on",
+    "please",
+    "pls",
+    "slot",
+    "sure",
+    "the",
+    "then",
+    "through",
+    "till",
+    "time",
+    "to",
+    "until",
+    "want",
+    "what",
+    "would",
+    "yes",
+}
+
+MONTH_PATTERN = "|".join(sorted(MONTHS, key=len, reverse=True))
+WEEKDAY_PATTERN = "|".join(sorted(WEEKDAYS, key=len, reverse=True))
+ORDINAL = r"(?:st|nd|rd|th)?"
+RANGE_SEPARATOR = r"(?:-|to|until|till|through|and)"
+MERIDIEM = r"(am|pm|a\.m\.?|p\.m\.?)"
+
+DateRange = Tuple[date, date]
+
+
+class ParsedDateTime(TypedDict):
+    start_date: NotRequired[str]
+    end_date: NotRequired[str]
+    start_time: NotRequired[str]
+    end_time: NotRequired[str]
+    complete: bool
+
+
+class _Tokens:
+    """Replaces recognized spans with placeholders that keep their values."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.dates: List[DateRange] = []
+        self.times: List[Tuple[str, Union[str, None]]] = []
+        self.ambiguous = False
+
+    def add_date(self, start: date, end: Union[date, None] = None) -> str:
+        self.dates.append((start, end or start))
+        return f" \x00d{len(self.dates) - 1}\x00 "
+
+    def add_time(self, start: str, end: Union[str, None] = None) -> str:
+        self.times.append((start, end))
+        return f" \x00t{len(self.times) - 1}\x00 "
+
+    def sub(self, pattern: str, replace):
+        def _replace(match: re.Match) -> str:
+            replacement = replace(match)
+            return match.group(0) if replacement is None else replacement
+
+        self.text = re.sub(pattern, _replace, self.text)
+
+
+def _infer_year(today: date, month: int, day: int, year: Union[str, None]):
+    if year:
+        year_number = int(year)
+        if year_number < 100:
+            year_number += 2000
+        return date(year_number, month, day)
+
+    candidate = date(today.year, month, day)
+    if candidate < today:
+        candidate = date(today.year + 1, month, day)
+    return candidate
+
+
+def _safe_date(today: date, month: int, day: int, year: Union[str, None]):
+    try:
+        return _infer_year(today, month, day, year)
+    except ValueError:
+        return None
+
+
+def _next_weekday(today: date, weekday: int) -> date:
+    return today + timedelta(days=(weekday - today.weekday()) % 7)
+
+
+def _format_time(hour: int, minute: int, meridiem: Union[str, None]):
+    if meridiem:
+        if hour < 1 or hour > 12:
+            return None
+        meridiem = meridiem.replace(".", "")
+        if meridiem == "pm" and hour != 12:
+            hour += 12
+        elif meridiem == "am" and hour == 12:
+            hour = 0
+
+    if hour > 23 or minute > 59:
+        return None
+
+    return f"{hour:02d}:{minute:02d}:00"
+
+
+def _parse_dates(tokens: _Tokens, today: date):
+    tokens.sub(
+        r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b",
+        lambda m: (
+            tokens.add_date(d)
+            if (d := _safe_date(today, int(m[2]), int(m[3]), m[1]))
+            else None
+        ),
+    )
+
+    # "20-25 nov", "from 20 to 25 november 2024"
+    def _day_range(m: re.Match):
+        month = MONTHS[m[3]]
+        start = _safe_date(today, month, int(m[1]), m[4])
+        end = _safe_date(today, month, int(m[2]), m[4])
+        if not start or not end or end < start:
+            return None
+        return tokens.add_date(start, end)
+
+    tokens.sub(
+        rf"\b(\d{{1,2}}){ORDINAL}\s*{RANGE_SEPARATOR}\s*(\d{{1,2}}){ORDINAL}"
+        rf"\s+(?:of\s+)?({MONTH_PATTERN})\.?(?:\s+(\d{{4}}))?\b",
+        _day_range,
+    )
+
+    # "nov 20-25"
+    def _month_day_range(m: re.Match):
+        month = MONTHS[m[1]]
+        start = _safe_date(today, month, int(m[2]), m[4])
+        end = _safe_date(today, month, int(m[3]), m[4])
+        if not start or not end or end < start:
+            return None
+        return tokens.add_date(start, end)
+
+    tokens.sub(
+        rf"\b({MONTH_PATTERN})\.?\s+(\d{{1,2}}){ORDINAL}\s*{RANGE_SEPARATOR}"
+        rf"\s*(\d{{1,2}}){ORDINAL}(?:\s+(\d{{4}}))?\b",
+        _month_day_range,
+    )
+
+    # "20 nov", "25th of november 2024"
+    tokens.sub(
+        rf"\b(\d{{1,2}}){ORDINAL}\s+(?:of\s+)?({MONTH_PATTERN})\.?"
+        rf"(?:\s+(\d{{4}}))?\b",
+        lambda m: (
+            tokens.add_date(d)
+            if (d := _safe_date(today, MONTHS[m[2]], int(m[1]), m[3]))
+            else None
+        ),
+    )
+
+    # "nov 20", "november 20th 2024"
+    tokens.sub(
+        rf"\b({MONTH_PATTERN})\.?\s+(\d{{1,2}}){ORDINAL}(?:\s+(\d{{4}}))?\b",
+        lambda m: (
+            tokens.add_date(d)
+            if (d := _safe_date(today, MONTHS[m[1]], int(m[2]), m[3]))
+            else None
+        ),
+    )
+
+    # "20/11/2024" is only accepted when day and month cannot be swapped
+    def _numeric(m: re.Match):
+        first, second = int(m[1]), int(m[2])
+        if first <= 12 and second <= 12 and first != second:
+            tokens.ambiguous = True
+            return None
+        day, month = (first, second) if first > 12 else (second, first)
+        d = _safe_date(today, month, day, m[3])
+        return tokens.add_date(d) if d else None
+
+    tokens.sub(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b", _numeric)
+
+    tokens.sub(
+        r"\bday after tomorrow\b",
+        lambda m: tokens.add_date(today + timedelta(days=2)),
+    )
+    tokens.sub(
+        r"\btomorrow\b", lambda m: tokens.add_date(today + timedelta(days=1))
+    )
+    tokens.sub(r"\btoday\b", lambda m: tokens.add_date(today))
+    tokens.sub(
+        r"\bin (\d{1,2}) days?\b",
+        lambda m: tokens.add_date(today + timedelta(days=int(m[1]))),
+    )
+
+    def _week(m: re.Match):
+        monday = today - timedelta(days=today.weekday())
+        if m[1] == "next":
+            monday += timedelta(days=7)
+            return tokens.add_date(monday, monday + timedelta(days=6))
+        return tokens.add_date(today, monday + timedelta(days=6))
+
+    tokens.sub(r"\b(next|this) week\b", _week)
+
+    # "next friday" can mean this coming friday or the one after it
+    def _weekday(m: re.Match):
+        if m[1] == "next":
+            tokens.ambiguous = True
+            return None
+        return tokens.add_date(_next_weekday(today, WEEKDAYS[m[2]]))
+
+    tokens.sub(rf"\b(?:(next|this|coming)\s+)?({WEEKDAY_PATTERN})\b", _weekday)
+
+
+def _parse_times(tokens: _Tokens):
+    # "10-11am", "10:30 to 11 pm" share the trailing meridiem
+    def _shared_meridiem(m: re.Match):
+        start = _format_time(int(m[1]), int(m[2] or 0), m[5])
+        end = _format_time(int(m[3]), int(m[4] or 0), m[5])
+        if not start or not end:
+            return None
+        return tokens.add_time(start, end)
+
+    tokens.sub(
+        rf"\b(\d{{1,2}})(?::(\d{{2}}))?\s*(?:-|to|until|till)\s*"
+        rf"(\d{{1,2}})(?::(\d{{2}}))?\s*{MERIDIEM}",
+        _shared_meridiem,
+    )
+
+    def _time(m: re.Match):
+        meridiem = m[4] if m.lastindex and m.lastindex >= 4 else None
+        formatted = _format_time(int(m[1]), int(m[2] or 0), meridiem)
+        return tokens.add_time(formatted) if formatted else None
+
+    tokens.sub(
+        rf"\b(\d{{1,2}})(?::(\d{{2}}))?(?::(\d{{2}}))?\s*{MERIDIEM}", _time
+    )
+    tokens.sub(r"\b(\d{1,2}):(\d{2})(?::(\d{2}))?\b", _time)
+    tokens.sub(r"\bnoon\b", lambda m: tokens.add_time("12:00:00"))
+    tokens.sub(r"\bmidnight\b", lambda m: tokens.add_time("00:00:00"))
+
+
+def _join_ranges(text: str, kind: str) -> List[Tuple[int, Union[int, None]]]:
+    """Pair placeholders joined by a range separator, eg `d0 to d1`."""
+    pairs: List[Tuple[int, Union[int, None]]] = []
+    pattern = (
+        rf"(?:(?:from|between)\s+)?\x00{kind}(\d+)\x00"
+        rf"(?:\s*{RANGE_SEPARATOR}\s*\x00{kind}(\d+)\x00)?"
+    )
+    for match in re.finditer(pattern, text):
+        pairs.append(
+            (int(match[1]), int(match[2]) if match[2] is not None else None)
+        )
+    return pairs
+
+
+def parse_date_time(
+    query: str, today: Union[date, None] = None
+) -> ParsedDateTime:
+    """Parse relative and absolute dates, date ranges and time ranges.
+
+    Args:
+        query (str): The user query.
+        today (date): The reference date for relative dates.
+
+    Returns:
+        ParsedDateTime: Dates as `yyyy-mm-dd` and times as `HH:MM:SS`.
+        `complete` is only true when every word of the query was understood
+        and nothing was ambiguous, so the values can be used without a model.
+    """
+
+    today = today or date.today()
+    text = re.sub(r"[,!?;]", " ", query.lower())
+    text = re.sub(r"\.(\s|$)", r"\1", text)
+
+    tokens = _Tokens(text)
+    _parse_dates(tokens, today)
+    _parse_times(tokens)
+
+    parsed: ParsedDateTime = {"complete": not tokens.ambiguous}
+
+    date_pairs = _join_ranges(tokens.text, "d")
+    if len(date_pairs) > 1:
+        parsed["complete"] = False
+    elif date_pairs:
+        first, last = date_pairs[0]
+        start = tokens.dates[first][0]
+        end = tokens.dates[last if last is not None else first][1]
+        if end < start:
+            parsed["complete"] = False
+        else:
+            parsed["start_date"] = start.isoformat()
+            parsed["end_date"] = end.isoformat()
+
+    time_pairs = _join_ranges(tokens.text, "t")
+    if len(time_pairs) > 1:
+        parsed["complete"] = False
+    elif time_pairs:
+        first, last = time_pairs[0]
+        start_time, end_time = tokens.times[first]
+        if last is not None:
+            end_time = tokens.times[last][0]
+        parsed["start_time"] = start_time
+        if end_time:
+            if end_time <= start_time:
+                parsed["complete"] = False
+            parsed["end_time"] = end_time
+
+    residue = re.sub(r"\x00[dt]\d+\x00", " ", tokens.text)
+    for word in re.split(r"[\s\-]+", residue):
+        if word and word not in FILLER_WORDS:
+            parsed["complete"] = False
+            break
+
+    return parsed
@@ -0,0 +1,77 @@
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Union
+import asyncio
+import inspect
+import logging
+import os
+import time
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds a user message may take before nodes fall back
+TURN_TIMEOUT = float(os.getenv("TURN_TIMEOUT_SECONDS") or 30)
+
+# Monotonic time at which the current turn expires. Tasks and executor
+# threads started by the graph inherit it.
+turn_deadline: ContextVar[Union[float, None]] = ContextVar(
+    "turn_deadline", default=None
+)
+
+
+class DeadlineExceeded(Exception):
+    """The turn ran out of time in a node without a fallback."""
+
+    def __init__(self, node: str):
+        super().__init__(f"Deadline exceeded in {node}")
+        self.node = node
+
+
+def start_deadline(timeout: float = TURN_TIMEOUT):
+    turn_deadline.set(time.monotonic() + timeout)
+
+
+def time_left(default: Union[float, None] = None) -> Union[float, None]:
+    """Seconds left in the current turn, or `default` outside of a turn."""
+    deadline = turn_deadline.get()
+    if deadline is None:
+        return default
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def with_deadline(
+    node: str,
+    func: Callable[[Any], Union[dict, Awaitable[dict]]],
+    fallback: Union[Callable[[Any], dict], None] = None,
+):
+    """Bound a graph node by the time left in the turn.
+
+    Args:
+        node (str): The node name, used for the `deadline_hits` counter.
+        func (Callable): The node function, sync or async.
+        fallback (Callable, optional): Builds the state update used when the
+            deadline expires. Without one `DeadlineExceeded` is raised.
+    """
+
+    async def run(state):
+        if inspect.iscoroutinefunction(func):
+            return await func(state)
+        return await asyncio.to_thread(func, state)
+
+    async def node_with_deadline(state):
+        timeout = time_left()
+        try:
+            if timeout is None:
+                return await run(state)
+            if timeout <= 0:
+                raise asyncio.TimeoutError
+            return await asyncio.wait_for(run(state), timeout)
+        except asyncio.TimeoutError:
+            metrics.incr(f"deadline_hits.{node}")
+            logger.warning("deadline exceeded in %s", node)
+            if fallback is None:
+                raise DeadlineExceeded(node)
+            return fallback(state)
+
+    return node_with_deadline
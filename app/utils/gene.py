@@ -1,11 +1,29 @@
-from langchain_openai import OpenAIEmbeddings
-from typing import Union, TypedDict, Literal, List, NotRequired
+from typing import (
+    Dict,
+    Union,
+    TypedDict,
+    Literal,
+    List,
+    NotRequired,
+    cast,
+)
 from langchain.schema import Document
 import faiss
+import numpy as np
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 import os
 
+from utils.cassette import make_embeddings
+from utils.bulk_embeddings import BulkEmbedder, content_hash
+from utils.quantized_index import QuantizedIndex, Quantization
+from utils.tracing import tracer
+
+# fp16, int8 or pq, the flat float32 index is used when unset
+GENE_QUANTIZATION = cast(
+    Union[Quantization, None], os.getenv("GENE_QUANTIZATION") or None
+)
+
 
 class DocumentMetadata(TypedDict):
     section: NotRequired[
@@ -24,23 +42,34 @@ class Gene:
         persist_index: str = "faiss_index",
         embeddings_model: str = "text-embedding-ada-002",
         embeddings_size: int = 1536,
+        quantization: Union[Quantization, None] = GENE_QUANTIZATION,
+        known_vectors: Union[Dict[str, np.ndarray], None] = None,
     ):
         self.should_persist = should_persist
         self.should_override_persist = should_override_persist
-        self.persist_index = persist_index
-        self.embeddings = OpenAIEmbeddings(model=embeddings_model)
+        # One absolute path for the saved check, load_local and save_local
+        self.persist_index = os.path.abspath(persist_index)
+        self.embeddings = make_embeddings(model=embeddings_model)
         self.embeddings_size = embeddings_size
+        self.known_vectors = known_vectors
         self.vector_store = self.load_vector_store(all_docs)
 
+        # Keep compressed codes in memory, the persisted index stays flat
+        if quantization:
+            self.vector_store.index = QuantizedIndex.from_index(
+                self.vector_store.index, quantization
+            )
+
     def persist(self, vector_store: FAISS):
         if not self.is_index_saved() or self.should_override_persist:
             vector_store.save_local(self.persist_index)
 
     def load_vector_store(self, docs: List[Document]):
 
-        if self.is_index_saved():
+        # Overriding the persisted index means building it from `docs`
+        if self.is_index_saved() and not self.should_override_persist:
             vector_store = FAISS.load_local(
-                "faiss_index",
+                self.persist_index,
                 self.embeddings,
                 allow_dangerous_deserialization=True,
             )
@@ -54,30 +83,74 @@ class Gene:
                 index_to_docstore_id={},
             )
 
-            docs_ids = [doc.id for doc in docs]
-            vector_store.add_documents(documents=docs, ids=docs_ids)
+            # Finished batches survive an interrupted build in .partial
+            embedder = BulkEmbedder(
+                self.embeddings, f"{self.persist_index}.partial"
+            )
+            vectors = embedder.embed(docs, self.known_vectors)
+            vector_store.add_embeddings(
+                text_embeddings=zip(
+                    [doc.page_content for doc in docs], vectors
+                ),
+                metadatas=[doc.metadata for doc in docs],
+                ids=[doc.id for doc in docs],
+            )
             if self.should_persist:
                 self.persist(vector_store)
+            embedder.clear_checkpoint()
 
         return vector_store
 
+    def vectors_by_content(self) -> Dict[str, np.ndarray]:
+        """Map the content hash of every indexed document to its vector."""
+        store = self.vector_store
+        vectors: Dict[str, np.ndarray] = {}
+        for position, doc_id in store.index_to_docstore_id.items():
+            doc = store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                key = content_hash(doc.page_content)
+                vectors[key] = store.index.reconstruct(position)
+        return vectors
+
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the index and the document texts."""
+        index = self.vector_store.index
+        if isinstance(index, QuantizedIndex):
+            index_bytes = index.memory_bytes()
+        else:
+            index_bytes = index.ntotal * index.d * 4
+        docs = self.vector_store.docstore._dict.values()
+        return index_bytes + sum(len(doc.page_content) for doc in docs)
+
     def is_index_saved(self) -> bool:
-        project_dir = os.path.dirname(
-            os.path.dirname(os.path.abspath(__file__))
-        )
-        index_file = os.path.join(
-            project_dir, self.persist_index, "index.faiss"
-        )
-        metadata_file = os.path.join(
-            project_dir, self.persist_index, "index.pkl"
-        )
+        index_file = os.path.join(self.persist_index, "index.faiss")
+        metadata_file = os.path.join(self.persist_index, "index.pkl")
         return os.path.exists(index_file) and os.path.exists(metadata_file)
 
+    def embed_query(self, query: str) -> List[float]:
+        with tracer.span("embedding", model=self.embeddings.model, texts=1):
+            return self.embeddings.embed_query(query)
+
     def search(
         self,
         query: str,
         k: int = 1,
         q_filter: Union[DocumentMetadata, None] = None,
+    ):
+        with tracer.span(
+            "gene.search", k=k, filter=q_filter, mmr=False
+        ) as span:
+            # Embedded once and reused by every filter fallback
+            embedding = self.embed_query(query)
+            results = self._search(embedding, k, q_filter)
+            span.set_attribute("results", len(results))
+            return results
+
+    def _search(
+        self,
+        embedding: List[float],
+        k: int,
+        q_filter: Union[DocumentMetadata, None],
     ):
         if q_filter:
             section = q_filter.get("section", None)
@@ -85,30 +158,30 @@ class Gene:
             service = q_filter.get("service", None)
 
             if tag:
-                results = self.vector_store.similarity_search(
-                    query, k=k, filter={"tag": tag}
+                results = self.vector_store.similarity_search_by_vector(
+                    embedding, k=k, filter={"tag": tag}
                 )
 
                 if results:
                     return results
 
             if service:
-                results = self.vector_store.similarity_search(
-                    query, k=k, filter={"services": service}
+                results = self.vector_store.similarity_search_by_vector(
+                    embedding, k=k, filter={"services": service}
                 )
 
                 if results:
                     return results
 
             if section:
-                results = self.vector_store.similarity_search(
-                    query, k=k, filter={"section": section}
+                results = self.vector_store.similarity_search_by_vector(
+                    embedding, k=k, filter={"section": section}
                 )
 
                 if results:
                     return results
 
-        results = self.vector_store.similarity_search(query, k=k)
+        results = self.vector_store.similarity_search_by_vector(embedding, k=k)
 
         return results
 
@@ -118,36 +191,51 @@ class Gene:
         k: int = 5,
         q_filter: Union[DocumentMetadata, None] = None,
     ):
+        with tracer.span(
+            "gene.search", k=k, filter=q_filter, mmr=True
+        ) as span:
+            embedding = self.embed_query(query)
+            results = self._search_mmr(embedding, k, q_filter)
+            span.set_attribute("results", len(results))
+            return results
+
+    def _search_mmr(
+        self,
+        embedding: List[float],
+        k: int,
+        q_filter: Union[DocumentMetadata, None],
+    ):
+        store = self.vector_store
         if q_filter:
             section = q_filter.get("section", None)
             tag = q_filter.get("tag", None)
             service = q_filter.get("service", None)
 
             if tag:
-                results = self.vector_store.max_marginal_relevance_search(
-                    query, k=k, filter={"tag": tag}
+                results = store.max_marginal_relevance_search_by_vector(
+                    embedding, k=k, filter={"tag": tag}
                 )
 
                 if results:
                     return results
 
             if service:
-                results = self.vector_store.similarity_search(
-                    query, k=k, filter={"services": service}
+                results = store.similarity_search_by_vector(
+                    embedding, k=k, filter={"services": service}
                 )
 
                 if results:
                     return results
 
             if section:
-                results = self.vector_store.max_marginal_relevance_search(
-                    query, k=k, filter={"section": section}
+                results = store.max_marginal_relevance_search_by_vector(
+                    embedding, k=k, filter={"section": section}
                 )
 
                 if results:
                     return results
 
-        results = self.vector_store.max_marginal_relevance_search(query, k=k)
+        results = store.max_marginal_relevance_search_by_vector(embedding, k=k)
 
         return results
 
@@ -1,9 +1,10 @@
 from typing import TypedDict
 import json
 import os
+import re
 from langchain.schema import Document
 from uuid import uuid4
-from typing import List
+from typing import Dict, List, Set
 from rapidfuzz import fuzz
 
 
@@ -11,10 +12,50 @@ START_DELIMITOR = "["
 END_DELIMITOR = "]"
 
 project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-
-def get_about_info_documents() -> List[Document]:
-    file_path = os.path.join(project_dir, "data", "about.json")
+DATA_DIR = os.path.join(project_dir, "data")
+
+# Words that do not tell specialties apart
+SPECIALTY_STOP_WORDS = {
+    "adult",
+    "and",
+    "clinical",
+    "consultant",
+    "correct",
+    "dealing",
+    "department",
+    "director",
+    "doctor",
+    "drugs",
+    "family",
+    "general",
+    "head",
+    "health",
+    "junior",
+    "medical",
+    "officer",
+    "operates",
+    "practitioner",
+    "problems",
+    "program",
+    "registrar",
+    "resident",
+    "science",
+    "senior",
+    "service",
+    "services",
+    "specialist",
+    "the",
+    "visiting",
+    "who",
+    "with",
+}
+
+SPECIALTY_SUFFIXES = ("ologist", "ology", "ologic", "ician", "ist", "ics")
+SPECIALTY_SUFFIXES += ("eon", "ery", "y", "s")
+
+
+def get_about_info_documents(data_dir: str = DATA_DIR) -> List[Document]:
+    file_path = os.path.join(data_dir, "about.json")
     documents: List[Document] = []
     with open(file_path, "r") as file:
         data = json.load(file)
@@ -32,8 +73,8 @@ def get_about_info_documents() -> List[Document]:
     return documents
 
 
-def get_contact_info_documents() -> List[Document]:
-    file_path = os.path.join(project_dir, "data", "contact.json")
+def get_contact_info_documents(data_dir: str = DATA_DIR) -> List[Document]:
+    file_path = os.path.join(data_dir, "contact.json")
     documents: List[Document] = []
     with open(file_path, "r") as file:
         data = json.load(file)
@@ -61,9 +102,9 @@ def get_doctor_services(name: str, services: List[dict]):
     return d_services
 
 
-def get_doctors_info_documents() -> List[Document]:
-    file_path = os.path.join(project_dir, "data", "doctors.json")
-    services_file_path = os.path.join(project_dir, "data", "services.json")
+def get_doctors_info_documents(data_dir: str = DATA_DIR) -> List[Document]:
+    file_path = os.path.join(data_dir, "doctors.json")
+    services_file_path = os.path.join(data_dir, "services.json")
     with open(services_file_path, "r") as file:
         services = json.load(file)
 
@@ -101,8 +142,8 @@ class ServiceDict(TypedDict):
     doctors: List[Doctor]
 
 
-def get_services_info_documents() -> List[Document]:
-    file_path = os.path.join(project_dir, "data", "services.json")
+def get_services_info_documents(data_dir: str = DATA_DIR) -> List[Document]:
+    file_path = os.path.join(data_dir, "services.json")
     documents: List[Document] = []
     with open(file_path, "r") as file:
         data: List[ServiceDict] = json.load(file)
@@ -134,8 +175,10 @@ def get_services_info_documents() -> List[Document]:
     return documents
 
 
-def get_useful_links_info_documents() -> List[Document]:
-    file_path = os.path.join(project_dir, "data", "usefulLinks.json")
+def get_useful_links_info_documents(
+    data_dir: str = DATA_DIR,
+) -> List[Document]:
+    file_path = os.path.join(data_dir, "usefulLinks.json")
     documents: List[Document] = []
     with open(file_path, "r") as file:
         data = json.load(file)
@@ -160,8 +203,10 @@ def get_useful_links_info_documents() -> List[Document]:
     return documents
 
 
-def get_doctor_speciality_documents() -> List[Document]:
-    file_path = os.path.join(project_dir, "data", "doctor_speciality.json")
+def get_doctor_speciality_documents(
+    data_dir: str = DATA_DIR,
+) -> List[Document]:
+    file_path = os.path.join(data_dir, "doctor_speciality.json")
     documents: List[Document] = []
     with open(file_path, "r") as file:
         data = json.load(file)
@@ -186,12 +231,142 @@ def get_doctor_speciality_documents() -> List[Document]:
     return documents
 
 
-def get_all_data_documents() -> List[Document]:
-    documents = get_about_info_documents()
-    documents.extend(get_contact_info_documents())
-    documents.extend(get_doctors_info_documents())
-    documents.extend(get_services_info_documents())
-    documents.extend(get_useful_links_info_documents())
-    documents.extend(get_doctor_speciality_documents())
+def get_all_data_documents(data_dir: str = DATA_DIR) -> List[Document]:
+    documents = get_about_info_documents(data_dir)
+    documents.extend(get_contact_info_documents(data_dir))
+    documents.extend(get_doctors_info_documents(data_dir))
+    documents.extend(get_services_info_documents(data_dir))
+    documents.extend(get_useful_links_info_documents(data_dir))
+    documents.extend(get_doctor_speciality_documents(data_dir))
 
     return documents
+
+
+class SpecialtyDoctor(TypedDict):
+    name: str
+    title: str
+    service: str
+
+
+def _specialty_words(text: str) -> Set[str]:
+    # cardiologist, cardiology -> cardi
+    words = set()
+    for word in re.findall(r"[a-z]+", text.lower()):
+        if len(word) < 3 or word in SPECIALTY_STOP_WORDS:
+            continue
+        for suffix in SPECIALTY_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[: -len(suffix)]
+                break
+        words.add(word)
+    return words
+
+
+def get_specialty_index(
+    data_dir: str = DATA_DIR,
+) -> Dict[str, List[SpecialtyDoctor]]:
+    """Map lowercase specialty names to the doctors practising them.
+
+    The keys are the service titles, the doctor titles, and the types and
+    aliases in doctor_speciality.json. A type is linked to the services whose
+    title or doctor titles share a word stem with it, eg `cardiologist` and
+    `Cardiology`.
+    """
+
+    services_file_path = os.path.join(data_dir, "services.json")
+    with open(services_file_path, "r") as file:
+        services: List[ServiceDict] = json.load(file)
+
+    speciality_file_path = os.path.join(data_dir, "doctor_speciality.json")
+    with open(speciality_file_path, "r") as file:
+        specialities = json.load(file)
+
+    index: Dict[str, List[SpecialtyDoctor]] = {}
+
+    def add(key: str, doctors: List[SpecialtyDoctor]):
+        key = key.strip().lower()
+        if not key or not doctors:
+            return
+        entries = index.setdefault(key, [])
+        for doctor in doctors:
+            if doctor not in entries:
+                entries.append(doctor)
+
+    service_words: Dict[str, Set[str]] = {}
+    service_doctors: Dict[str, List[SpecialtyDoctor]] = {}
+    for service in services:
+        doctors: List[SpecialtyDoctor] = [
+            {
+                "name": doctor["name"],
+                "title": doctor["title"],
+                "service": service["title"],
+            }
+            for doctor in service["doctors"]
+        ]
+        service_doctors[service["title"]] = doctors
+        service_words[service["title"]] = _specialty_words(service["title"])
+        add(service["title"], doctors)
+
+        for doctor in doctors:
+            service_words[service["title"]] |= _specialty_words(
+                doctor["title"]
+            )
+            add(doctor["title"], [doctor])
+
+    for speciality in specialities:
+        aliases = re.split(r",| or ", speciality["also_referred_to_as"])
+        words = _specialty_words(
+            f"{speciality['type']} {speciality['also_referred_to_as']}"
+        )
+
+        doctors = []
+        for title, stems in service_words.items():
+            if any(
+                _similar_stems(word, stem) for word in words for stem in stems
+            ):
+                doctors.extend(service_doctors[title])
+
+        for key in [speciality["type"], *aliases]:
+            add(key, doctors)
+
+    return index
+
+
+def _similar_stems(a: str, b: str) -> bool:
+    # Short stems like "ent" or "ear" only match exactly
+    if min(len(a), len(b)) < 5:
+        return a == b
+    return fuzz.ratio(a, b) >= 85
+
+
+def find_specialty_doctors(
+    index: Dict[str, List[SpecialtyDoctor]],
+    specialists: List[str],
+    score_cutoff: float = 92,
+) -> List[SpecialtyDoctor]:
+    """Resolve specialists named by the user to doctors with a fuzzy lookup.
+
+    Args:
+        index (Dict[str, List[SpecialtyDoctor]]): From `get_specialty_index`.
+        specialists (List[str]): The specialists mentioned in the query.
+        score_cutoff (float): The minimum score, out of 100, for the whole
+            name to match a key.
+    """
+
+    doctors: List[SpecialtyDoctor] = []
+    for specialist in specialists:
+        query = specialist.strip().lower()
+        query_words = _specialty_words(query)
+        for key, key_doctors in index.items():
+            # Whole name, eg "gynecologist", or a shared stem, eg "skin"
+            if fuzz.ratio(query, key) < score_cutoff and not any(
+                _similar_stems(word, key_word)
+                for word in query_words
+                for key_word in _specialty_words(key)
+            ):
+                continue
+            for doctor in key_doctors:
+                if doctor not in doctors:
+                    doctors.append(doctor)
+
+    return doctors
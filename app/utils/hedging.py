@@ -0,0 +1,122 @@
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Set, TypeVar, Union
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from utils.metrics import metrics
+
+T = TypeVar("T")
+
+# Nodes whose model calls are hedged, eg "detect_patient_intent,find_doctor"
+HEDGED_NODES = {
+    node.strip()
+    for node in (os.getenv("HEDGED_NODES") or "").split(",")
+    if node.strip()
+}
+# A duplicate is sent once a call takes longer than this latency percentile
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE") or 95)
+# Largest share of a node's calls that may be duplicated
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET") or 0.05)
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY_SECONDS") or 0.2)
+# Latencies observed before a node is hedged, and how many are kept
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+
+
+class Hedger:
+    """Sends a second copy of slow calls and keeps the first to succeed.
+
+    The delay before the copy is the `percentile` of the node's recent
+    latencies, so roughly `100 - percentile` percent of calls are candidates.
+    At most a `budget` share of each node's calls is duplicated, which caps
+    the extra spend when the whole API slows down.
+    """
+
+    def __init__(
+        self,
+        nodes: Set[str] = HEDGED_NODES,
+        percentile: float = HEDGE_PERCENTILE,
+        budget: float = HEDGE_BUDGET,
+        min_delay: float = HEDGE_MIN_DELAY,
+    ):
+        self.nodes = nodes
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.calls: Dict[str, int] = {}
+        self.hedges: Dict[str, int] = {}
+
+    def delay(self, node: str) -> Union[float, None]:
+        latencies = self.latencies.get(node, ())
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        percentile = float(np.percentile(latencies, self.percentile))
+        return max(percentile, self.min_delay)
+
+    def record(self, node: str, seconds: float):
+        latencies = self.latencies.setdefault(
+            node, deque(maxlen=HEDGE_WINDOW)
+        )
+        latencies.append(seconds)
+
+    async def run(self, node: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Await `call`, hedged when `node` is one of the hedged nodes.
+
+        Args:
+            node (str): The graph node making the call.
+            call (Callable[[], Awaitable[T]]): Starts one attempt.
+        """
+
+        if node not in self.nodes:
+            return await call()
+
+        self.calls[node] = self.calls.get(node, 0) + 1
+        metrics.incr(f"hedge.{node}.calls")
+        delay = self.delay(node)
+        if delay is not None:
+            metrics.set(f"hedge.{node}.delay", delay)
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(call())
+        attempts = [primary]
+        try:
+            if delay is not None:
+                await asyncio.wait(attempts, timeout=delay)
+
+            if primary.done() or delay is None:
+                result = await primary
+            elif self.hedges.get(node, 0) >= self.budget * self.calls[node]:
+                metrics.incr(f"hedge.{node}.over_budget")
+                result = await primary
+            else:
+                self.hedges[node] = self.hedges.get(node, 0) + 1
+                metrics.incr(f"hedge.{node}.sent")
+                attempts.append(asyncio.ensure_future(call()))
+                result = await self.first_success(node, attempts)
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+
+        self.record(node, time.perf_counter() - started)
+        return result
+
+    async def first_success(
+        self, node: str, attempts: List[asyncio.Future]
+    ) -> T:
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for attempt in done:
+                if attempt.exception() is None:
+                    if attempt is not attempts[0]:
+                        metrics.incr(f"hedge.{node}.won")
+                    return attempt.result()
+
+        # Both failed, report the original call's error
+        raise attempts[0].exception()
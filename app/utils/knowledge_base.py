@@ -0,0 +1,107 @@
+from typing import Dict, List
+import asyncio
+import glob
+import logging
+import os
+import time
+
+from utils.gene import Gene
+from utils.get_text_data import (
+    DATA_DIR,
+    SpecialtyDoctor,
+    get_all_data_documents,
+    get_specialty_index,
+)
+from utils.metrics import metrics
+from utils.specialty_classifier import SpecialtyClassifier
+
+logger = logging.getLogger(__name__)
+
+
+class Knowledge:
+    """Everything built from the hospital data files, swapped as one."""
+
+    def __init__(
+        self, version: int, gene: Gene, data_dir: str, hospital_name: str
+    ):
+        self.version = version
+        self.gene = gene
+        self.hospital_name = hospital_name
+        self.specialty_index: Dict[str, List[SpecialtyDoctor]] = (
+            get_specialty_index(data_dir)
+        )
+        self.specialty_classifier = SpecialtyClassifier(
+            gene, self.specialty_index
+        )
+
+    def memory_bytes(self) -> int:
+        return self.gene.memory_bytes() + self.specialty_classifier.nbytes()
+
+
+class KnowledgeBase:
+    """Holds the live Knowledge of a hospital and rebuilds it on demand.
+
+    A reload builds a new Gene in a worker thread, reusing the vectors of the
+    documents that did not change, then replaces `current` in one assignment.
+    Searches that already hold the previous Knowledge finish on it.
+    """
+
+    def __init__(
+        self,
+        tenant: str,
+        hospital_name: str,
+        data_dir: str = DATA_DIR,
+        persist_index: str = "faiss_index",
+    ):
+        self.tenant = tenant
+        self.hospital_name = hospital_name
+        self.data_dir = data_dir
+        self.persist_index = persist_index
+        self.seen = self.data_mtime()
+        gene = Gene(
+            get_all_data_documents(data_dir), persist_index=persist_index
+        )
+        self.current = Knowledge(1, gene, data_dir, hospital_name)
+        self.lock = asyncio.Lock()
+        metrics.set(f"gene.index_version.{tenant}", 1)
+
+    def build(self) -> Knowledge:
+        gene = Gene(
+            get_all_data_documents(self.data_dir),
+            should_override_persist=True,
+            persist_index=self.persist_index,
+            known_vectors=self.current.gene.vectors_by_content(),
+        )
+        return Knowledge(
+            self.current.version + 1, gene, self.data_dir, self.hospital_name
+        )
+
+    async def reload(self) -> Knowledge:
+        # A reload requested during another one waits and rebuilds again,
+        # so it always sees the files as they were when it was requested
+        async with self.lock:
+            started = time.perf_counter()
+            self.seen = self.data_mtime()
+            try:
+                knowledge = await asyncio.to_thread(self.build)
+            except Exception:
+                metrics.incr("gene.reload_failures")
+                raise
+
+            self.current = knowledge
+            metrics.observe("gene.reload", time.perf_counter() - started)
+            metrics.set(f"gene.index_version.{self.tenant}", knowledge.version)
+            logger.info(
+                "%s knowledge base reloaded, version %s",
+                self.tenant,
+                knowledge.version,
+            )
+            return knowledge
+
+    async def reload_if_changed(self):
+        if self.data_mtime() != self.seen:
+            await self.reload()
+
+    def data_mtime(self) -> float:
+        paths = glob.glob(os.path.join(self.data_dir, "*.json"))
+        return max((os.path.getmtime(path) for path in paths), default=0)
@@ -0,0 +1,65 @@
+from collections import defaultdict
+from typing import Dict, TypedDict
+import threading
+
+
+class Timing(TypedDict):
+    count: int
+    total: float
+    max: float
+
+
+class Metrics:
+    """In-process counters, gauges and timings shared by the whole worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, Timing] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def set(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            timing = self.timings.setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0}
+            )
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    def _hit_rates(self) -> Dict[str, float]:
+        """Share of `<name>.hit` over `<name>.hit` + `<name>.miss`."""
+        rates = {}
+        for name in self.counters:
+            prefix, _, outcome = name.rpartition(".")
+            if outcome in ("hit", "miss") and prefix not in rates:
+                hits = self.counters.get(f"{prefix}.hit", 0)
+                total = hits + self.counters.get(f"{prefix}.miss", 0)
+                rates[prefix] = hits / total if total else 0.0
+        return rates
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "hit_rates": self._hit_rates(),
+                "timings": {
+                    name: {
+                        **timing,
+                        "avg": timing["total"] / timing["count"],
+                    }
+                    for name, timing in self.timings.items()
+                },
+            }
+
+
+metrics = Metrics()
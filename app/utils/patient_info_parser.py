@@ -0,0 +1,191 @@
+from typing import NotRequired, TypedDict
+import re
+
+EMAIL_PATTERN = re.compile(
+    r"\b[a-z0-9](?:[a-z0-9._%+-]*[a-z0-9])?@(?:[a-z0-9-]+\.)+[a-z]{2,}\b",
+    re.IGNORECASE,
+)
+
+NAME_PATTERN = re.compile(
+    r"\b(?:my (?:full )?name is|my name's|name is|name:|call me)\s+"
+    r"([a-z][a-z'\-]*(?:\s+[a-z][a-z'\-]*){0,4})",
+    re.IGNORECASE,
+)
+
+REASON_PATTERN = re.compile(
+    r"\b(?:the reason is|reason is|reason:|reason being)\s+([^.!?\n]+)",
+    re.IGNORECASE,
+)
+
+# Words that end a name, eg "my name is Jane Doe and my email is ..." or
+# "my name is Jane Doe, thanks"
+NAME_STOP_WORDS = {
+    "and",
+    "but",
+    "can't",
+    "don't",
+    "e-mail",
+    "email",
+    "for",
+    "i",
+    "is",
+    "isn't",
+    "my",
+    "never",
+    "no",
+    "nope",
+    "not",
+    "ok",
+    "okay",
+    "please",
+    "reason",
+    "so",
+    "thank",
+    "thanks",
+    "the",
+    "won't",
+    "yes",
+}
+
+# Words after "my name is" or "call me" that mean no name was given, eg
+# "my name is private" or "Call me back". The model handles those queries.
+NOT_NAME_WORDS = {
+    "again",
+    "anonymous",
+    "anytime",
+    "back",
+    "confidential",
+    "important",
+    "irrelevant",
+    "later",
+    "maybe",
+    "none",
+    "nothing",
+    "now",
+    "private",
+    "secret",
+    "soon",
+    "today",
+    "tomorrow",
+    "tonight",
+    "unimportant",
+    "unknown",
+}
+
+NAME_TOKEN = re.compile(r"[a-z]+(?:['\-][a-z]+)*", re.IGNORECASE)
+
+# "call me maybe" or "call me back" cannot be told from a name without
+# capitals, so lowercase queries using it are left to the model
+AMBIGUOUS_NAME_TRIGGER = re.compile(r"call me\b", re.IGNORECASE)
+
+# Words that may surround the extracted fields without adding information.
+# Anything else left in the query makes the extraction incomplete.
+FILLER_WORDS = {
+    "address",
+    "and",
+    "at",
+    "email",
+    "e-mail",
+    "hello",
+    "here",
+    "hi",
+    "is",
+    "it",
+    "it's",
+    "its",
+    "mail",
+    "my",
+    "ok",
+    "okay",
+    "please",
+    "sure",
+    "thank",
+    "thanks",
+    "the",
+    "yes",
+    "you",
+}
+
+
+class PatientInfo(TypedDict):
+    full_name: NotRequired[str]
+    email: NotRequired[str]
+    reason: NotRequired[str]
+    complete: bool
+
+
+def _looks_like_name(word: str, query: str) -> bool:
+    if not NAME_TOKEN.fullmatch(word) or word.lower() in NOT_NAME_WORDS:
+        return False
+    if len(word) == 1 and not word.isupper():
+        return False
+    # A query typed with capitals capitalizes the name too
+    return query.islower() or word[0].isupper()
+
+
+def _extract_name(query: str):
+    match = NAME_PATTERN.search(query)
+    if not match:
+        return None, query
+
+    words = []
+    end = match.start(1)
+    for word in re.finditer(r"\S+", match[1]):
+        if word[0].lower() in NAME_STOP_WORDS:
+            break
+        words.append(word[0])
+        end = match.start(1) + word.end()
+
+    if not words or not all(_looks_like_name(w, query) for w in words):
+        return None, query
+    if query.islower() and AMBIGUOUS_NAME_TRIGGER.match(match[0]):
+        return None, query
+
+    name = " ".join(words)
+    if query.islower():
+        # "jean-luc o'neil" is saved as "Jean-Luc O'Neil"
+        name = re.sub(r"[a-z]+", lambda part: part[0].capitalize(), name)
+
+    return name, query[: match.start()] + " " + query[end:]
+
+
+def extract_patient_info(query: str) -> PatientInfo:
+    """Extract the patient's name, email and reason without a model.
+
+    Args:
+        query (str): The user query.
+
+    Returns:
+        PatientInfo: The fields that were found. `complete` is only true when
+        every word of the query was accounted for, so the result can be used
+        in place of the structured model call.
+    """
+
+    info: PatientInfo = {"complete": True}
+    rest = query
+
+    emails = EMAIL_PATTERN.findall(rest)
+    if len(emails) > 1:
+        info["complete"] = False
+    elif emails:
+        info["email"] = emails[0]
+        rest = EMAIL_PATTERN.sub(" ", rest)
+
+    reason = REASON_PATTERN.search(rest)
+    if reason:
+        info["reason"] = reason[1].strip()
+        rest = rest[: reason.start()] + " " + rest[reason.end() :]
+
+    name, rest = _extract_name(rest)
+    if name:
+        info["full_name"] = name
+
+    for word in re.split(r"[\s,.:;!?]+", rest.lower()):
+        if word and word not in FILLER_WORDS:
+            info["complete"] = False
+            break
+
+    if len(info) == 1:
+        info["complete"] = False
+
+    return info
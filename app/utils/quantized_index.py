@@ -0,0 +1,104 @@
+from typing import Literal, Tuple
+import faiss
+import numpy as np
+import tempfile
+
+Quantization = Literal["fp16", "int8", "pq"]
+
+# Sub-vectors per embedding for product quantization, 1536 / 48 = 32 dims each
+PQ_SUBQUANTIZERS = 48
+
+
+class QuantizedIndex:
+    """A compressed FAISS index whose top candidates are re-ranked exactly.
+
+    Only the compressed codes are kept in memory. The float32 vectors are
+    written to a memory-mapped file and read back for the `k * rerank_factor`
+    candidates of each search, so results match the flat index closely.
+
+    It implements the parts of the faiss index API used by the LangChain
+    FAISS vector store (`search`, `reconstruct` and `ntotal`).
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        quantization: Quantization,
+        rerank_factor: int = 4,
+    ):
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.d = vectors.shape[1]
+
+        self.index = self.build_index(vectors, quantization)
+
+        # Exact vectors stay on disk, the page cache holds the hot ones
+        self.vectors_file = tempfile.NamedTemporaryFile(suffix=".f32")
+        self.vectors = np.memmap(
+            self.vectors_file.name,
+            dtype=np.float32,
+            mode="w+",
+            shape=vectors.shape,
+        )
+        self.vectors[:] = vectors
+        self.vectors.flush()
+
+    @classmethod
+    def from_index(
+        cls, index: faiss.Index, quantization: Quantization, **kwargs
+    ) -> "QuantizedIndex":
+        vectors = index.reconstruct_n(0, index.ntotal)
+        return cls(vectors, quantization, **kwargs)
+
+    @staticmethod
+    def build_index(
+        vectors: np.ndarray, quantization: Quantization
+    ) -> faiss.Index:
+        d = vectors.shape[1]
+        if quantization == "fp16":
+            index = faiss.IndexScalarQuantizer(
+                d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2
+            )
+        elif quantization == "int8":
+            index = faiss.IndexScalarQuantizer(
+                d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2
+            )
+        elif quantization == "pq":
+            # No more centroids per sub-vector than training vectors
+            nbits = int(min(8, max(1, np.log2(max(len(vectors), 2)))))
+            index = faiss.IndexPQ(d, PQ_SUBQUANTIZERS, nbits, faiss.METRIC_L2)
+        else:
+            raise ValueError(f"Unknown quantization: {quantization}")
+
+        index.train(vectors)
+        index.add(vectors)
+        return index
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def search(self, x: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        candidates = min(k * self.rerank_factor, self.ntotal)
+        _, approximate = self.index.search(x, candidates)
+
+        distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        indices = np.full((len(x), k), -1, dtype=np.int64)
+        for row, query in enumerate(x):
+            ids = approximate[row][approximate[row] >= 0]
+            exact = ((self.vectors[ids] - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            distances[row, : len(order)] = exact[order]
+            indices[row, : len(order)] = ids[order]
+
+        return distances, indices
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.array(self.vectors[i])
+
+    def reconstruct_n(self, i0: int, n: int) -> np.ndarray:
+        return np.array(self.vectors[i0 : i0 + n])
+
+    def memory_bytes(self) -> int:
+        """Bytes held in memory by the compressed index."""
+        return faiss.serialize_index(self.index).nbytes
@@ -0,0 +1,68 @@
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import copy
+
+from utils.metrics import metrics
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one call between concurrent callers that ask for the same key.
+
+    The first caller starts the call in its own task and later callers with
+    the same key wait for it, until it finishes. Followers get a deep copy of
+    the result so the states of different conversations never share objects.
+    A caller that is cancelled stops waiting without cancelling the call,
+    unless it was the last one waiting.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.flights: Dict[str, _Flight] = {}
+
+    async def do(
+        self, key: str, call: Callable[[], Awaitable[Any]], group: str = ""
+    ) -> Any:
+        """Run `call`, or wait for the in-flight call with the same key.
+
+        Args:
+            key (str): Identifies calls whose results are interchangeable.
+            call (Callable[[], Awaitable[Any]]): Starts the call.
+            group (str): Suffix of the per-group metrics, eg the schema.
+        """
+
+        flight = self.flights.get(key)
+        leader = flight is None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self.forget(key, flight))
+            metrics.incr(f"{self.name}.calls")
+            if group:
+                metrics.incr(f"{self.name}.calls.{group}")
+        else:
+            metrics.incr(f"{self.name}.coalesced")
+            if group:
+                metrics.incr(f"{self.name}.coalesced.{group}")
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.task.cancel()
+                self.forget(key, flight)
+            raise
+        finally:
+            flight.waiters -= 1
+
+        return result if leader else copy.deepcopy(result)
+
+    def forget(self, key: str, flight: _Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
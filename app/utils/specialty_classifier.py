@@ -0,0 +1,101 @@
+from typing import Dict, List, Tuple
+import numpy as np
+
+from utils.gene import Gene
+from utils.get_text_data import SpecialtyDoctor
+from utils.tracing import tracer
+
+# Centered cosine similarity below which a specialty is not suggested
+MIN_SIMILARITY = 0.1
+
+
+class SpecialtyClassifier:
+    """Nearest-centroid classifier from symptoms to specialties.
+
+    Each entry of doctor_speciality.json gets a centroid made of its own
+    embedding and the embeddings of the services its doctors work in. The
+    vectors are read back from the FAISS index, so building the classifier
+    does not call the embeddings API. Vectors are centered on the corpus
+    mean first, otherwise specialties spanning many services sit close to
+    every query.
+    """
+
+    def __init__(
+        self, gene: Gene, specialty_index: Dict[str, List[SpecialtyDoctor]]
+    ):
+        self.gene = gene
+
+        vector_store = gene.vector_store
+        self.mean = np.mean(
+            vector_store.index.reconstruct_n(0, vector_store.index.ntotal),
+            axis=0,
+        )
+
+        vectors: Dict[Tuple[str, str], np.ndarray] = {}
+        for position, doc_id in vector_store.index_to_docstore_id.items():
+            doc = vector_store.docstore.search(doc_id)
+            section = doc.metadata.get("section")
+            if section in ("doctor_speciality", "services"):
+                key = (section, doc.metadata["tag"])
+                vectors[key] = self.normalize(
+                    vector_store.index.reconstruct(position) - self.mean
+                )
+
+        names: List[str] = []
+        centroids: List[np.ndarray] = []
+        for (section, tag), vector in vectors.items():
+            if section != "doctor_speciality":
+                continue
+
+            services = {
+                doctor["service"].lower()
+                for doctor in specialty_index.get(tag, [])
+            }
+            members = [vector] + [
+                vectors[("services", service)]
+                for service in services
+                if ("services", service) in vectors
+            ]
+            names.append(tag)
+            centroids.append(self.normalize(np.mean(members, axis=0)))
+
+        self.specialties = names
+        self.centroids = np.array(centroids, dtype=np.float32)
+
+    def nbytes(self) -> int:
+        return self.centroids.nbytes + self.mean.nbytes
+
+    @staticmethod
+    def normalize(vector: np.ndarray) -> np.ndarray:
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def rank(self, embedding: List[float], k: int) -> List[Tuple[str, float]]:
+        if not self.specialties:
+            return []
+
+        query = self.normalize(
+            np.array(embedding, dtype=np.float32) - self.mean
+        )
+        scores = self.centroids @ query
+        top = np.argsort(-scores)[:k]
+        return [(self.specialties[i], float(scores[i])) for i in top]
+
+    async def aclassify(
+        self, symptoms: str, k: int = 2, min_similarity: float = MIN_SIMILARITY
+    ) -> List[Tuple[str, float]]:
+        """Return up to `k` closest specialties with their cosine similarity.
+
+        Args:
+            symptoms (str): The symptoms described by the patient.
+            k (int): The maximum number of specialties to return.
+            min_similarity (float): Specialties below it are left out.
+        """
+
+        embeddings = self.gene.embeddings
+        with tracer.span("embedding", model=embeddings.model, texts=1):
+            embedding = await embeddings.aembed_query(symptoms)
+        return [
+            (name, score)
+            for name, score in self.rank(embedding, k)
+            if score >= min_similarity
+        ]
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, TypedDict, Union
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from utils.get_text_data import DATA_DIR, project_dir
+from utils.knowledge_base import KnowledgeBase
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+# Hospital served by the default tenant, backed by app/data and faiss_index
+HOSPITAL_NAME = os.getenv("HOSPITAL_NAME") or "King Faisal Hospital"
+# One directory per extra hospital: <tenant>/tenant.json, <tenant>/data/*.json
+TENANTS_DIR = os.getenv("TENANTS_DIR") or os.path.join(project_dir, "tenants")
+# Loaded indexes are evicted, least recently used first, above this budget
+TENANT_MEMORY_BUDGET_MB = float(os.getenv("TENANT_MEMORY_BUDGET_MB") or 1024)
+# Seconds between checks of the data files for changes, 0 disables the watcher
+KNOWLEDGE_POLL_SECONDS = float(os.getenv("KNOWLEDGE_POLL_SECONDS") or 0)
+
+TENANT_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+# The knowledge base of the hospital the current turn is for
+current_knowledge_base: ContextVar[Union[KnowledgeBase, None]] = ContextVar(
+    "current_knowledge_base", default=None
+)
+
+
+class UnknownTenant(Exception):
+    pass
+
+
+class TenantConfig(TypedDict):
+    hospital_name: str
+    data_dir: str
+    persist_index: str
+
+
+class TenantRegistry:
+    """Lazily loaded knowledge bases of every hospital served by the worker.
+
+    A tenant is loaded on first use and kept in LRU order. When the loaded
+    indexes use more than `memory_budget` bytes, the least recently used ones
+    are dropped and load again on their next use. Turns in flight keep the
+    knowledge base they started with.
+    """
+
+    def __init__(
+        self,
+        tenants_dir: str = TENANTS_DIR,
+        memory_budget: float = TENANT_MEMORY_BUDGET_MB * 2**20,
+        poll_interval: float = KNOWLEDGE_POLL_SECONDS,
+    ):
+        self.tenants_dir = tenants_dir
+        self.memory_budget = memory_budget
+        self.poll_interval = poll_interval
+        self.loaded: OrderedDict[str, KnowledgeBase] = OrderedDict()
+        self.lock = threading.Lock()
+        self.loading: Dict[str, threading.Lock] = {}
+        self.task: Union[asyncio.Task, None] = None
+
+    def config(self, tenant: str) -> TenantConfig:
+        if tenant == DEFAULT_TENANT:
+            return {
+                "hospital_name": HOSPITAL_NAME,
+                "data_dir": DATA_DIR,
+                "persist_index": "faiss_index",
+            }
+
+        tenant_dir = os.path.join(self.tenants_dir, tenant)
+        config_file = os.path.join(tenant_dir, "tenant.json")
+        if not TENANT_PATTERN.match(tenant) or not os.path.exists(config_file):
+            raise UnknownTenant(f"Unknown tenant: {tenant}")
+
+        with open(config_file, "r") as file:
+            config = json.load(file)
+
+        return {
+            "hospital_name": config["hospital_name"],
+            "data_dir": os.path.join(tenant_dir, "data"),
+            "persist_index": os.path.join(tenant_dir, "faiss_index"),
+        }
+
+    def get(self, tenant: str = DEFAULT_TENANT) -> KnowledgeBase:
+        """Return the knowledge base of a tenant, loading it if needed.
+
+        Args:
+            tenant (str): The tenant id, `default` for app/data.
+        """
+
+        with self.lock:
+            knowledge_base = self.loaded.get(tenant)
+            if knowledge_base:
+                self.loaded.move_to_end(tenant)
+                return knowledge_base
+            loading = self.loading.setdefault(tenant, threading.Lock())
+
+        # Other tenants stay available while this one loads
+        with loading:
+            with self.lock:
+                knowledge_base = self.loaded.get(tenant)
+                if knowledge_base:
+                    return knowledge_base
+
+            config = self.config(tenant)
+            started = time.perf_counter()
+            knowledge_base = KnowledgeBase(tenant, **config)
+            metrics.observe("tenants.load", time.perf_counter() - started)
+
+            with self.lock:
+                self.loaded[tenant] = knowledge_base
+                self.loading.pop(tenant, None)
+                self.evict()
+            return knowledge_base
+
+    async def aget(self, tenant: str = DEFAULT_TENANT) -> KnowledgeBase:
+        # Loading reads or builds an index, keep it off the event loop
+        if tenant in self.loaded:
+            return self.get(tenant)
+        return await asyncio.to_thread(self.get, tenant)
+
+    def memory_bytes(self) -> Dict[str, int]:
+        return {
+            tenant: knowledge_base.current.memory_bytes()
+            for tenant, knowledge_base in self.loaded.items()
+        }
+
+    def evict(self):
+        sizes = self.memory_bytes()
+        total = sum(sizes.values())
+        # The most recently used tenant stays, even when over budget alone
+        while total > self.memory_budget and len(self.loaded) > 1:
+            tenant, _ = self.loaded.popitem(last=False)
+            total -= sizes[tenant]
+            metrics.incr("tenants.evictions")
+            logger.info("evicted tenant %s", tenant)
+
+        metrics.set("tenants.loaded", len(self.loaded))
+        metrics.set("tenants.memory_bytes", total)
+
+    def start(self):
+        if self.poll_interval > 0:
+            self.task = asyncio.create_task(self.watch())
+
+    async def stop(self):
+        if not self.task:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for knowledge_base in list(self.loaded.values()):
+                try:
+                    await knowledge_base.reload_if_changed()
+                except Exception:
+                    logger.exception("%s reload failed", knowledge_base.tenant)
@@ -0,0 +1,150 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Union
+from uuid import uuid4
+import asyncio
+import json
+import os
+import threading
+import time
+
+# "json" writes finished spans to TRACE_PATH, spans are dropped when unset
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER") or None
+TRACE_PATH = os.getenv("TRACE_PATH") or "traces.jsonl"
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Union[str, None],
+        attributes: Dict[str, Any],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: Union[float, None] = None
+        self.status = "ok"
+        self.error: Union[str, None] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        if isinstance(error, asyncio.CancelledError):
+            self.status = "cancelled"
+        else:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": ((self.end or time.time()) - self.start) * 1000,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter:
+    """Receives every finished span, subclass it to send spans elsewhere.
+
+    The base class drops them.
+    """
+
+    def export(self, span: Span):
+        pass
+
+
+class JsonFileExporter(SpanExporter):
+    """Appends each finished span to a JSON lines file."""
+
+    def __init__(self, path: str = TRACE_PATH):
+        self.lock = threading.Lock()
+        self.file = open(path, "a")
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+
+# The innermost span open in this task or thread, parent of the next one
+current_span: ContextVar[Union[Span, None]] = ContextVar(
+    "current_span", default=None
+)
+
+
+class Tracer:
+    """Creates spans nested through `current_span` and exports them.
+
+    Tasks and threads started inside a span copy the context, so graph
+    nodes, model calls and searches become children of the turn's span.
+    """
+
+    def __init__(self, exporter: SpanExporter):
+        self.exporter = exporter
+
+    def start_span(self, name: str, **attributes: Any) -> Span:
+        parent = current_span.get()
+        return Span(
+            name,
+            parent.trace_id if parent else uuid4().hex,
+            parent.span_id if parent else None,
+            attributes,
+        )
+
+    def end_span(self, span: Span):
+        span.end = time.time()
+        self.exporter.export(span)
+
+    @contextmanager
+    def activate(self, span: Span) -> Iterator[Span]:
+        """Make `span` the parent of new spans without ending it."""
+        token = current_span.set(span)
+        try:
+            yield span
+        finally:
+            current_span.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        span = self.start_span(name, **attributes)
+        try:
+            with self.activate(span):
+                yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            self.end_span(span)
+
+
+def current_trace_id() -> Union[str, None]:
+    span = current_span.get()
+    return span.trace_id if span else None
+
+
+def traced_node(name: str, func: Callable[[Any], Awaitable[dict]]):
+    """Run an async graph node inside a `node` span."""
+
+    async def node_with_span(state):
+        with tracer.span("node", node=name):
+            return await func(state)
+
+    return node_with_span
+
+
+tracer = Tracer(
+    JsonFileExporter() if TRACE_EXPORTER == "json" else SpanExporter()
+)
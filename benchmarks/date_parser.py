@@ -0,0 +1,128 @@
+"""Run the date/time fast path over a corpus of booking replies.
+
+Reports how often the parser can answer without calling the model and
+whether the answers it gives are correct.
+
+    python benchmarks/date_parser.py
+"""
+
+from datetime import date
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from utils.date_parser import parse_date_time  # noqa: E402
+
+# Monday
+TODAY = date(2024, 11, 18)
+
+# (query, expected fields) - None means the model has to be called
+CORPUS = [
+    ("tomorrow", {"start_date": "2024-11-19", "end_date": "2024-11-19"}),
+    ("today please", {"start_date": "2024-11-18", "end_date": "2024-11-18"}),
+    (
+        "day after tomorrow",
+        {"start_date": "2024-11-20", "end_date": "2024-11-20"},
+    ),
+    ("20 Nov", {"start_date": "2024-11-20", "end_date": "2024-11-20"}),
+    ("25 Nov 2024", {"start_date": "2024-11-25", "end_date": "2024-11-25"}),
+    (
+        "on the 25th of November",
+        {"start_date": "2024-11-25", "end_date": "2024-11-25"},
+    ),
+    ("Nov 22", {"start_date": "2024-11-22", "end_date": "2024-11-22"}),
+    (
+        "december 3rd, 2024",
+        {"start_date": "2024-12-03", "end_date": "2024-12-03"},
+    ),
+    ("2024-11-29", {"start_date": "2024-11-29", "end_date": "2024-11-29"}),
+    ("29/11/2024", {"start_date": "2024-11-29", "end_date": "2024-11-29"}),
+    (
+        "from 20 to 25 Nov",
+        {"start_date": "2024-11-20", "end_date": "2024-11-25"},
+    ),
+    ("20-25 november", {"start_date": "2024-11-20", "end_date": "2024-11-25"}),
+    (
+        "between 20 and 22 Nov",
+        {"start_date": "2024-11-20", "end_date": "2024-11-22"},
+    ),
+    ("nov 20-25", {"start_date": "2024-11-20", "end_date": "2024-11-25"}),
+    (
+        "from 28 Dec to 3 Jan",
+        {"start_date": "2024-12-28", "end_date": "2025-01-03"},
+    ),
+    (
+        "from tomorrow to friday",
+        {"start_date": "2024-11-19", "end_date": "2024-11-22"},
+    ),
+    ("next week", {"start_date": "2024-11-25", "end_date": "2024-12-01"}),
+    ("this week", {"start_date": "2024-11-18", "end_date": "2024-11-24"}),
+    ("wednesday", {"start_date": "2024-11-20", "end_date": "2024-11-20"}),
+    ("in 3 days", {"start_date": "2024-11-21", "end_date": "2024-11-21"}),
+    ("10:00 to 10:30", {"start_time": "10:00:00", "end_time": "10:30:00"}),
+    ("from 9am to 9:30am", {"start_time": "09:00:00", "end_time": "09:30:00"}),
+    ("2-3pm", {"start_time": "14:00:00", "end_time": "15:00:00"}),
+    ("14:00 - 14:30", {"start_time": "14:00:00", "end_time": "14:30:00"}),
+    (
+        "20 Nov from 10:00 to 10:30",
+        {
+            "start_date": "2024-11-20",
+            "end_date": "2024-11-20",
+            "start_time": "10:00:00",
+            "end_time": "10:30:00",
+        },
+    ),
+    (
+        "tomorrow at 11 a.m. to 11:30 a.m.",
+        {
+            "start_date": "2024-11-19",
+            "end_date": "2024-11-19",
+            "start_time": "11:00:00",
+            "end_time": "11:30:00",
+        },
+    ),
+    ("at noon", {"start_time": "12:00:00"}),
+    # Needs the model
+    ("next friday", None),
+    ("05/11/2024", None),
+    ("Dr. Sam on 20 Nov", None),
+    ("actually cancel that", None),
+    ("sometime early next month", None),
+    ("the first slot", None),
+    ("10 to 10:30", None),
+    ("I have a headache since tomorrow", None),
+]
+
+
+def main():
+    hits = 0
+    wrong = []
+    started = time.perf_counter()
+    for query, expected in CORPUS:
+        parsed = parse_date_time(query, today=TODAY)
+        complete = parsed.pop("complete")
+        if complete:
+            hits += 1
+        if expected is None:
+            if complete:
+                wrong.append((query, parsed, "expected a model fallback"))
+        elif not complete:
+            wrong.append((query, parsed, "expected the fast path"))
+        elif parsed != expected:
+            wrong.append((query, parsed, expected))
+    elapsed = time.perf_counter() - started
+
+    print(f"queries:        {len(CORPUS)}")
+    print(f"fast path hits: {hits} ({hits / len(CORPUS):.0%})")
+    print(f"avg parse time: {elapsed / len(CORPUS) * 1e6:.1f} us")
+    print(f"mismatches:     {len(wrong)}")
+    for query, parsed, expected in wrong:
+        print(f"  {query!r}: got {parsed}, expected {expected}")
+
+    return 1 if wrong else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Compare per-request feedback commits with the batched write-behind queue.
+
+A local SQLite file stands in for the remote libsql database: every
+statement and commit sleeps for `--rtt` milliseconds to simulate the network
+round trip. Reports throughput and the worst event loop stall seen by a
+ticker task, which is what other WebSocket connections on the worker feel.
+
+    python benchmarks/feedback_writes.py --requests 200 --rtt 30
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+workdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/feedback.db"
+os.environ.pop("DATABASE_AUTH_TOKEN", None)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from db.feedback_db import Base, Feedback  # noqa: E402
+from db.feedback_writer import FeedbackWriter  # noqa: E402
+
+
+def remote_like_session_factory(path: str, rtt: float) -> sessionmaker:
+    engine = create_engine(
+        f"sqlite:///{path}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _statement_latency(*args):
+        time.sleep(rtt)
+
+    @event.listens_for(engine, "commit")
+    def _commit_latency(*args):
+        time.sleep(rtt)
+
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def make_entry(i: int) -> Feedback:
+    return Feedback(
+        feedback="up" if i % 4 else "down",
+        comments="benchmark",
+        message_type="chat-message",
+        message=f"message {i}",
+        user_message=f"user message {i}",
+    )
+
+
+async def watch_loop_lag(stop: asyncio.Event, interval: float = 0.005):
+    worst = 0.0
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - started - interval)
+    return worst
+
+
+async def inline_commits(session_factory: sessionmaker, requests: int):
+    # What submit_feedback used to do: a blocking commit on the event loop
+    async def submit(i: int):
+        db = session_factory()
+        try:
+            entry = make_entry(i)
+            db.add(entry)
+            db.commit()
+            db.refresh(entry)
+            return entry.id
+        finally:
+            db.close()
+
+    await asyncio.gather(*(submit(i) for i in range(requests)))
+
+
+async def batched_writes(session_factory: sessionmaker, requests: int):
+    writer = FeedbackWriter(session_factory=session_factory)
+    writer.start()
+    await asyncio.gather(
+        *(writer.submit(make_entry(i)) for i in range(requests))
+    )
+    await writer.stop()
+
+
+async def measure(name: str, run, session_factory, requests: int):
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop_lag(stop))
+    started = time.perf_counter()
+    await run(session_factory, requests)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    worst_lag = await watcher
+    print(
+        f"{name:<16} {elapsed:8.2f}s {requests / elapsed:10.1f} writes/s "
+        f"{worst_lag * 1000:10.1f}ms max loop stall"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rtt", type=float, default=30, help="milliseconds")
+    args = parser.parse_args()
+    rtt = args.rtt / 1000
+
+    print(f"{args.requests} feedback writes, {args.rtt:.0f}ms simulated RTT")
+    print(f"{'mode':<16} {'total':>9} {'throughput':>17} {'stall':>23}")
+    asyncio.run(
+        measure(
+            "inline commit",
+            inline_commits,
+            remote_like_session_factory(f"{workdir}/inline.db", rtt),
+            args.requests,
+        )
+    )
+    asyncio.run(
+        measure(
+            "write-behind",
+            batched_writes,
+            remote_like_session_factory(f"{workdir}/batched.db", rtt),
+            args.requests,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
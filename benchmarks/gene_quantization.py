@@ -0,0 +1,106 @@
+"""Compare the flat Gene index with the quantized ones.
+
+Loads the persisted `faiss_index`, so no embeddings are requested. Queries
+are the midpoints of random pairs of stored documents with a little noise,
+and the flat IndexFlatL2 results are the ground truth. Reports memory,
+recall@k of the compressed codes alone and after exact re-ranking, and the
+search latency.
+
+    python benchmarks/gene_quantization.py --queries 500 --k 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from utils.quantized_index import QuantizedIndex  # noqa: E402
+
+INDEX_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "faiss_index", "index.faiss"
+)
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(0, len(vectors), size=(count, 2))
+    queries = (vectors[pairs[:, 0]] + vectors[pairs[:, 1]]) / 2
+    queries += rng.normal(0, 0.01, size=queries.shape)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries.astype(np.float32)
+
+
+def recall(expected: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(
+        len(set(row) & set(other)) for row, other in zip(expected, found)
+    )
+    return hits / expected.size
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    started = time.perf_counter()
+    _, found = index.search(queries, k)
+    elapsed = (time.perf_counter() - started) / len(queries) * 1e6
+    return found, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument(
+        "--projected-docs",
+        type=int,
+        default=100_000,
+        help="corpus size for the projected memory column",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    flat = faiss.read_index(INDEX_PATH)
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    queries = make_queries(vectors, args.queries, args.seed)
+    expected, flat_us = timed_search(flat, queries, args.k)
+
+    flat_bytes = faiss.serialize_index(flat).nbytes
+    print(
+        f"{flat.ntotal} documents, {flat.d} dims, {args.queries} queries, "
+        f"k={args.k}, re-ranking {args.k * args.rerank_factor} candidates"
+    )
+    print(
+        f"{'index':<8} {'memory':>10} {'bytes/doc':>10} "
+        f"{'projected':>10} {'codes':>9} {'reranked':>9} {'search':>9}"
+    )
+    projected = flat_bytes / flat.ntotal * args.projected_docs
+    print(
+        f"{'flat':<8} {flat_bytes / 1024:>8.0f}KB {flat.d * 4:>10} "
+        f"{projected / 2**20:>8.0f}MB {1.0:>9.3f} {1.0:>9.3f} "
+        f"{flat_us:>7.0f}us"
+    )
+
+    for quantization in ("fp16", "int8", "pq"):
+        index = QuantizedIndex(
+            vectors, quantization, rerank_factor=args.rerank_factor
+        )
+        codes, _ = timed_search(index.index, queries, args.k)
+        reranked, search_us = timed_search(index, queries, args.k)
+
+        code_size = index.index.sa_code_size()
+        fixed = index.memory_bytes() - code_size * index.ntotal
+        projected = fixed + code_size * args.projected_docs
+        print(
+            f"{quantization:<8} {index.memory_bytes() / 1024:>8.0f}KB "
+            f"{code_size:>10} {projected / 2**20:>8.0f}MB "
+            f"{recall(expected, codes):>9.3f} "
+            f"{recall(expected, reranked):>9.3f} {search_us:>7.0f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Compare the latency, cost and answers of each model tier.
+
+Sends the prompts of the nodes in the fast tier by default (intent detection
+and slot extraction) to the model of every tier, and reports the latency
+percentiles, the tokens, the cost per 1000 calls and how often a tier gives
+the same structured answer as the quality tier. Calls the OpenAI API, so
+OPENAI_API_KEY must be set; FAST_MODEL and QUALITY_MODEL pick the models.
+
+    python benchmarks/model_tiers.py --repeats 5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.messages import AnyMessage
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+load_dotenv()
+
+from graph.booking_appointment import (  # noqa: E402
+    get_appointment_confirmation_system_prompt,
+    get_appointment_date_context_prompt,
+    get_appointment_date_system_prompt,
+    get_appointment_info_system_prompt,
+)
+from graph.prelimary import patient_intent_system_prompt  # noqa: E402
+from graph.runnables import build_messages  # noqa: E402
+from graph.shared import (  # noqa: E402
+    MODEL_TIERS,
+    AppointmentDate,
+    AppointmentInfo,
+    ConfirmBooking,
+    PatientIntent,
+    llms,
+)
+
+# USD per million input and output tokens
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+DATE_CONTEXT = get_appointment_date_context_prompt.format(
+    start_date="2024-11-18", end_date="2024-11-22"
+)
+
+# (node, schema, messages)
+CASES: List[Tuple[str, type, List[AnyMessage]]] = [
+    *(
+        (
+            "detect_patient_intent",
+            PatientIntent,
+            build_messages(patient_intent_system_prompt, query=query),
+        )
+        for query in (
+            "hi",
+            "what are your visiting hours?",
+            "I need to see a cardiologist next week",
+            "where is the radiology department?",
+            "thanks, that's all",
+        )
+    ),
+    *(
+        (
+            "get_appointment_date_time",
+            AppointmentDate,
+            build_messages(
+                get_appointment_date_system_prompt, (), DATE_CONTEXT, query
+            ),
+        )
+        for query in (
+            "Wednesday morning around 10 works",
+            "the first slot on the 20th please",
+            "actually, cancel this",
+        )
+    ),
+    *(
+        (
+            "get_appointment_info",
+            AppointmentInfo,
+            build_messages(get_appointment_info_system_prompt, query=query),
+        )
+        for query in (
+            "Jane Doe",
+            "I'm Eric, eric@mail.rw, I keep getting migraines",
+            "why do you need my email?",
+        )
+    ),
+    *(
+        (
+            "get_appointment_confirmation",
+            ConfirmBooking,
+            build_messages(
+                get_appointment_confirmation_system_prompt, query=query
+            ),
+        )
+        for query in (
+            "yes, book it",
+            "make it 11:00 instead",
+            "hmm, not sure",
+        )
+    ),
+]
+
+
+def cost_per_1000(model: str, tokens_in: float, tokens_out: float) -> str:
+    if model not in PRICES:
+        return "n/a"
+    price_in, price_out = PRICES[model]
+    return f"${(tokens_in * price_in + tokens_out * price_out) / 1000:.3f}"
+
+
+async def run_tier(tier: str, repeats: int):
+    """Return per node latencies, token counts and the parsed answers."""
+    results: Dict[str, dict] = {}
+    for node, schema, messages in CASES:
+        runnable = llms[tier].with_structured_output(schema, include_raw=True)
+        entry = results.setdefault(
+            node, {"latencies": [], "in": [], "out": [], "answers": []}
+        )
+        for _ in range(repeats):
+            started = time.perf_counter()
+            output = await runnable.ainvoke(messages)
+            entry["latencies"].append(time.perf_counter() - started)
+            usage = output["raw"].usage_metadata or {}
+            entry["in"].append(usage.get("input_tokens", 0))
+            entry["out"].append(usage.get("output_tokens", 0))
+            parsed: BaseModel = output["parsed"]
+            entry["answers"].append(parsed.model_dump() if parsed else None)
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {
+        tier: await run_tier(tier, args.repeats) for tier in MODEL_TIERS
+    }
+
+    print(f"{len(CASES)} prompts x {args.repeats} repeats per tier")
+    print(
+        f"{'tier':<8} {'model':<12} {'node':<29} {'p50':>7} {'p95':>7} "
+        f"{'in':>5} {'out':>4} {'per 1k':>8} {'agrees':>7}"
+    )
+    for tier, model in MODEL_TIERS.items():
+        for node, entry in results[tier].items():
+            latencies = np.array(entry["latencies"]) * 1000
+            tokens_in = float(np.mean(entry["in"]))
+            tokens_out = float(np.mean(entry["out"]))
+            reference = results["quality"][node]["answers"]
+            agrees = np.mean(
+                [a == b for a, b in zip(entry["answers"], reference)]
+            )
+            print(
+                f"{tier:<8} {model:<12} {node:<29} "
+                f"{np.percentile(latencies, 50):>5.0f}ms "
+                f"{np.percentile(latencies, 95):>5.0f}ms "
+                f"{tokens_in:>5.0f} {tokens_out:>4.0f} "
+                f"{cost_per_1000(model, tokens_in, tokens_out):>8} "
+                f"{agrees:>7.0%}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""Run the patient details fast path over a corpus of booking replies.
+
+python benchmarks/patient_info_parser.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from utils.patient_info_parser import extract_patient_info  # noqa: E402
+
+# (query, expected fields) - None means the model has to be called
+CORPUS = [
+    ("jane@doe.com", {"email": "jane@doe.com"}),
+    (
+        "my email is jane.doe+kfh@example.co.rw",
+        {"email": "jane.doe+kfh@example.co.rw"},
+    ),
+    ("My name is Jane Doe", {"full_name": "Jane Doe"}),
+    ("call me John Baptist Mugisha", {"full_name": "John Baptist Mugisha"}),
+    ("my name is jean-luc o'neil", {"full_name": "Jean-Luc O'Neil"}),
+    (
+        "My name is Jane Doe and my email is jane@doe.com",
+        {"full_name": "Jane Doe", "email": "jane@doe.com"},
+    ),
+    (
+        "name: Eric Habimana, email: eric@mail.rw. Reason: recurring migraines",
+        {
+            "full_name": "Eric Habimana",
+            "email": "eric@mail.rw",
+            "reason": "recurring migraines",
+        },
+    ),
+    ("the reason is chest pain", {"reason": "chest pain"}),
+    ("sure, it's jane@doe.com thanks", {"email": "jane@doe.com"}),
+    # Needs the model
+    ("Jane Doe", None),
+    ("I have had a fever for three days", None),
+    ("jane@doe.com, actually cancel the booking", None),
+    ("jane@doe.com or jane@work.com", None),
+    ("my name is Jane and I have a cough", None),
+    ("jane at doe dot com", None),
+    ("hello", None),
+    ("call me maybe", None),
+    ("Call me Maybe", None),
+    ("call me jane doe", None),
+]
+
+
+def main():
+    hits = 0
+    wrong = []
+    started = time.perf_counter()
+    for query, expected in CORPUS:
+        extracted = extract_patient_info(query)
+        complete = extracted.pop("complete")
+        if complete:
+            hits += 1
+        if expected is None:
+            if complete:
+                wrong.append((query, extracted, "expected a model fallback"))
+        elif not complete:
+            wrong.append((query, extracted, "expected the fast path"))
+        elif extracted != expected:
+            wrong.append((query, extracted, expected))
+    elapsed = time.perf_counter() - started
+
+    print(f"queries:        {len(CORPUS)}")
+    print(f"fast path hits: {hits} ({hits / len(CORPUS):.0%})")
+    print(f"avg parse time: {elapsed / len(CORPUS) * 1e6:.1f} us")
+    print(f"mismatches:     {len(wrong)}")
+    for query, extracted, expected in wrong:
+        print(f"  {query!r}: got {extracted}, expected {expected}")
+
+    return 1 if wrong else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Run conversations through the graph with recorded model responses.
+
+Record the conversations once against the OpenAI API, then replay them
+offline as often as needed:
+
+    CASSETTE_MODE=record python benchmarks/replay_conversations.py
+    CASSETTE_MODE=replay python benchmarks/replay_conversations.py --runs 5
+
+Replay waits as long as each recorded call took, or CASSETTE_LATENCY seconds
+when it is set. With CASSETTE_LATENCY=0 the turn time is our own overhead:
+routing, retrieval, parsing and checkpoints. Otherwise the model column sums
+every call, including the ones that overlap, such as the retrieval running
+alongside intent detection. `--conversations` takes a JSON list of
+conversations, each a list of user messages.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from uuid import uuid4
+
+import numpy as np
+
+os.environ.setdefault("CASSETTE_MODE", "replay")
+if os.environ["CASSETTE_MODE"] == "replay":
+    # Never used, the client only needs one to be constructed
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from graph.graph import (  # noqa: E402
+    build_hospital_system_graph,
+    get_memory_config,
+)
+from utils.cassette import get_cassette  # noqa: E402
+from utils.deadline import start_deadline  # noqa: E402
+from utils.metrics import metrics  # noqa: E402
+
+CONVERSATIONS = [
+    ["hi", "what are your visiting hours?", "thanks"],
+    ["where is the cardiology department?", "how do I get there?"],
+    ["what services do you offer for children?"],
+    [
+        "I have had chest pain for two days, who should I see?",
+        "I don't know the doctor's name",
+    ],
+    ["do you have a neurologist?", "what about a dermatologist?"],
+    ["can you tell me the weather tomorrow?"],
+]
+
+
+def model_seconds() -> float:
+    # Time spent in recorded calls, or waiting for replayed ones
+    timings = metrics.snapshot()["timings"]
+    timing = timings.get(f"cassette.{os.environ['CASSETTE_MODE']}")
+    return timing["total"] if timing else 0.0
+
+
+async def run_conversation(graph, messages):
+    config = get_memory_config(f"replay-{uuid4()}")
+    turns = []
+    for message in messages:
+        state = graph.get_state(config)
+        start_deadline()
+        waited = model_seconds()
+        started = time.perf_counter()
+        if state.next:
+            graph.update_state(config, {"query": message, "status": "running"})
+            stream = graph.astream(None, config, stream_mode="values")
+        else:
+            stream = graph.astream(
+                {"query": message, "status": "running"},
+                config,
+                stream_mode="values",
+            )
+        try:
+            async for _ in stream:
+                pass
+        except Exception as e:
+            print(f"turn failed: {message!r}: {e}")
+            continue
+        elapsed = time.perf_counter() - started
+        turns.append((elapsed, model_seconds() - waited))
+    return turns
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--conversations", default=None)
+    args = parser.parse_args()
+
+    conversations = CONVERSATIONS
+    if args.conversations:
+        with open(args.conversations, "r") as file:
+            conversations = json.load(file)
+
+    graph = build_hospital_system_graph()
+    mode = os.environ["CASSETTE_MODE"]
+    runs = 1 if mode == "record" else args.runs
+    turns = []
+    for _ in range(runs):
+        # Every run may use the fallback responses again
+        get_cassette().used.clear()
+        for messages in conversations:
+            turns.extend(await run_conversation(graph, messages))
+
+    if not turns:
+        return
+
+    total = np.array([elapsed for elapsed, _ in turns]) * 1000
+    model = np.array([waited for _, waited in turns]) * 1000
+    overhead = total - model
+    print(f"{mode}: {len(turns)} turns over {runs} run(s)")
+    print(f"{'':<10} {'p50':>8} {'p95':>8} {'mean':>8}")
+    for name, values in (
+        ("turn", total),
+        ("model", model),
+        ("overhead", overhead),
+    ):
+        print(
+            f"{name:<10} {np.percentile(values, 50):>6.0f}ms "
+            f"{np.percentile(values, 95):>6.0f}ms {values.mean():>6.0f}ms"
+        )
+    counters = metrics.snapshot()["counters"]
+    print(
+        "cassette hits {:.0f}, fallbacks {:.0f}, misses {:.0f}".format(
+            counters.get("cassette.hit", 0),
+            counters.get("cassette.fallback", 0),
+            counters.get("cassette.miss", 0),
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+"""Compare JSON text frames with MessagePack binary frames.
+
+Builds the messages `process_event` sends, the availability list with the
+same helpers, and reports the payload size and serialization time of each encoding, with and without permessage-deflate
+(raw DEFLATE with a shared context, as negotiated by browsers).
+
+    python benchmarks/ws_framing.py --days 14 --doctors 10
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import date, timedelta
+
+import msgpack
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from utils.availability import (  # noqa: E402
+    availability_message,
+    compact_availability,
+)
+
+
+def loading_state() -> dict:
+    return {
+        "type": "loading-state",
+        "state": "loading",
+        "message": "Checking for doctor's availability...",
+    }
+
+
+def chat_message() -> dict:
+    return {
+        "message": (
+            "### Visiting Hours\n\n"
+            "- **Weekdays**: 10:00 - 12:00 and 16:00 - 19:00\n"
+            "- **Weekends**: 10:00 - 19:00\n\n"
+            "Children under 12 must be accompanied by an adult. "
+            "Is there anything else I can help you with?"
+        ),
+        "type": "chat-message",
+        "role": "system",
+        "status": "success",
+    }
+
+
+def availability_list(days: int) -> dict:
+    start = date(2024, 11, 18)
+    availability = []
+    for day in range(days):
+        for hour in range(9, 17):
+            for minute in (0, 30):
+                availability.append(
+                    {
+                        "date": (start + timedelta(days=day)).isoformat(),
+                        "startTime": f"{hour:02d}:{minute:02d}:00",
+                        "endTime": f"{hour + minute // 30:02d}:"
+                        f"{(minute + 30) % 60:02d}:00",
+                        # Booked slots split each day into several ranges
+                        "isBooked": (day + hour) % 3 == 0,
+                    }
+                )
+    # The first page of compacted days, as check_doctors_availability stores
+    # them and process_event sends them
+    return availability_message(
+        compact_availability(availability),
+        message_before="Here are the available slots for Dr. Sam Smith:",
+        message_after="Please select a slot or enter a time.",
+    )
+
+
+def doctors_list(doctors: int) -> dict:
+    # Doctor.to_dict of each recommended doctor
+    return {
+        "doctors": [
+            {"name": f"Dr. Doctor Number {i}", "title": "Cardiologist"}
+            for i in range(doctors)
+        ],
+        "type": "doctors-list",
+        "role": "system",
+        "status": "success",
+        "messageBefore": "Cardiologists treat conditions of the heart.",
+        "messageAfter": "Please select a doctor from the list.",
+    }
+
+
+def encode_json(message: dict) -> bytes:
+    # Same separators as WebSocket.send_json
+    return json.dumps(
+        message, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def encode_msgpack(message: dict) -> bytes:
+    return msgpack.packb(message)
+
+
+def deflate(payload: bytes) -> bytes:
+    compressor = zlib.compressobj(wbits=-15)
+    return compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def timed(encode, message: dict, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        encode(message)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--doctors", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    messages = {
+        "loading-state": loading_state(),
+        "chat-message": chat_message(),
+        "availability-list": availability_list(args.days),
+        "doctors-list": doctors_list(args.doctors),
+    }
+
+    print(
+        f"{'message':<18} {'encoding':<9} {'bytes':>8} {'deflated':>9} "
+        f"{'encode':>10}"
+    )
+    for name, message in messages.items():
+        for encoding, encode in (
+            ("json", encode_json),
+            ("msgpack", encode_msgpack),
+        ):
+            payload = encode(message)
+            print(
+                f"{name:<18} {encoding:<9} {len(payload):>8} "
+                f"{len(deflate(payload)):>9} "
+                f"{timed(encode, message, args.repeat):>8.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()